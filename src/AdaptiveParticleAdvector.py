@@ -0,0 +1,162 @@
+from numpy import identity, einsum, tile, zeros, arange, abs, minimum, maximum, finfo
+
+from ParticleAdvector import *
+
+
+class AdaptiveParticleAdvector(ParticleAdvector):
+    '''
+    Runge-Kutta particle update with per-particle step size control by an
+    embedded pair (EmbeddedButcherTableau, e.g. BogackiShampine or
+    DormandPrince).
+
+    Every particle sub-steps through the grid step dt on its own: a sub-step
+    of size h is accepted if the estimated position error
+    |h * sum(e_i k_i)| (max norm) does not exceed tolerance, and the next
+    step size is h * safety * (tolerance/error)^(1/(q+1)), limited to
+    [minFactor, maxFactor] times h, where q is the order of the embedded
+    solution.  Each particle first tries the whole grid step, so particles in
+    quiet regions take a single step.  Steps are never reduced below
+    dt/maxSubsteps; such steps are accepted regardless of the error.
+
+    Stage fields are evaluated at the stage time within the grid step
+    (velocity + time * apparent acceleration), as in ParticleAdvector.
+
+    variables:
+        self.tolerance     # admissible position error per sub-step
+        self.safety   = 0.9
+        self.minFactor = 0.2
+        self.maxFactor = 5.0
+        self.maxSubsteps = 1000
+        self.substepCount  # accepted sub-steps since the last resetStatistics()
+        self.rejectCount   # rejected sub-steps since the last resetStatistics()
+
+    methods:
+        def __init__(self, scheme=DormandPrince(), tolerance=1.e-6, chunkSize=None)
+        def setTimeIntegrator(self, scheme)
+        def setTolerance(self, tolerance)
+        def advanceChunk(self, pset, fields, dt, start, stop, t0=0.0)
+        def getStatistics(self)     # adds sub-steps and rejections to ParticleAdvector.getStatistics
+        def resetStatistics(self)
+    '''
+
+    def __init__(self, scheme=DormandPrince(), tolerance=1.e-6, chunkSize=None):
+        '''
+        Constructor
+        '''
+        super().__init__(scheme, chunkSize)
+        self.setTimeIntegrator(scheme)
+        self.tolerance   = tolerance
+        self.safety      = 0.9
+        self.minFactor   = 0.2
+        self.maxFactor   = 5.0
+        self.maxSubsteps = 1000
+
+    def __str__(self):
+        return "AdaptiveParticleAdvector({}, tolerance={})".format(self.scheme, self.tolerance)
+
+    def setTimeIntegrator(self, scheme):
+        if not isinstance(scheme, EmbeddedButcherTableau):
+            raise ValueError("adaptive advection requires an embedded pair, not {}".format(scheme))
+        self.scheme = scheme
+
+    def setTolerance(self, tolerance):
+        self.tolerance = tolerance
+
+    def advanceChunk(self, pset, fields, dt, start, stop, t0=0.0):
+        # this is the Butcher tableau, scaled per particle by its step size below
+        a = self.scheme.get_a()  # time factors
+        b = self.scheme.get_b()  # position factors
+        c = self.scheme.get_c()  # update factors
+        e = self.scheme.get_e()  # error factors
+        exponent = 1. / (self.scheme.get_order() + 1)
+
+        X0 = pset.position[start:stop].copy()
+        nP = len(X0)
+
+        X    = X0.copy()
+        F    = pset.deformationGradient[start:stop].copy()
+        step = zeros(nP) + dt    # dt and t0 may be given per particle
+        tau  = zeros(nP) + t0    # time reached within the grid step
+        end  = tau + step        # time to reach within the grid step
+        h    = step.copy()       # next step size
+        hMin = step / self.maxSubsteps
+        outside = 0
+
+        active = arange(nP)
+        while (len(active) > 0):
+            x  = X[active]
+            hh = h[active]
+            t  = tau[active]
+            n  = len(active)
+
+            kI = []
+            fI = []
+            Dv = []
+
+            dF  = tile(identity(2), (n,1,1))
+            xn1 = x.copy()
+            err = zeros((n,2))
+
+            for i in range(len(a)):
+                xi = x.copy()
+                f  = tile(identity(2), (n,1,1))
+
+                for j in range(i):
+                    if (b[i][j] != 0.):
+                        xi += (b[i][j] * hh)[:,None] * kI[j]
+                        f  += (b[i][j] * hh)[:,None,None] * einsum('nij,njk->nik', Dv[j], fI[j])
+
+                vel, grad, nOut = fields.evaluate(xi, (t + a[i] * hh)[:,None])
+                outside += nOut
+
+                kI.append(vel)
+                Dv.append(grad)
+                fI.append(f)
+
+                # particle position, error estimate and incremental deformation gradient
+                xn1 += (c[i] * hh)[:,None] * kI[-1]
+                err += (e[i] * hh)[:,None] * kI[-1]
+                dF  += (c[i] * hh)[:,None,None] * einsum('nij,njk->nik', Dv[-1], fI[-1])
+
+            error  = abs(err).max(axis=1)
+            accept = (error <= self.tolerance) | (hh <= hMin[active])
+
+            done = active[accept]
+            X[done]    = xn1[accept]
+            F[done]    = einsum('nij,njk->nik', dF[accept], F[done])
+            tau[done] += hh[accept]
+
+            self.substepCount += accept.sum()
+            self.rejectCount  += n - accept.sum()
+
+            # next step size, limited to the rest of the grid step
+            factor = self.safety * (self.tolerance / maximum(error, finfo(float).tiny))**exponent
+            factor = minimum(maximum(factor, self.minFactor), self.maxFactor)
+            remaining = end[active] - tau[active]
+            h[active] = minimum(maximum(hh * factor, hMin[active]), remaining)
+
+            active = active[remaining > 1.e-12 * step[active]]
+
+        # update particle position ...
+        pset.addToPositions(X - X0, start, stop)
+
+        # update particle velocity ...
+        vel, grad, nOut = fields.evaluate(X, end[:,None], gradients=False)
+        outside += nOut
+        pset.velocity[start:stop] = vel
+
+        # update the deformation gradient ...
+        pset.deformationGradient[start:stop] = F
+
+        return outside
+
+    def getStatistics(self):
+        stats = super().getStatistics()
+        stats['substeps'] = self.substepCount
+        stats['rejected'] = self.rejectCount
+        return stats
+
+    def resetStatistics(self):
+        super().resetStatistics()
+        self.substepCount = 0
+        self.rejectCount  = 0
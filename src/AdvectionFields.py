@@ -0,0 +1,162 @@
+from numpy import stack, einsum, minimum, maximum, zeros
+
+
+class AdvectionFields(object):
+    '''
+    Cell-wise velocity and apparent acceleration fields as seen by the
+    particles, plus the grid geometry needed to locate points.
+
+    The methods only read the fields, so several threads may evaluate the
+    same fields at once (see FieldInterpolator).
+
+    The arrays follow the cell id order of Domain.cells and are normally
+    references to the Domain's CellState, i.e., the values last gathered by
+    the cells -- the same values Cell.GetVelocity / GetApparentAccel use.
+    copy() creates an independent snapshot.
+
+    variables:
+        self.kernel      = ElementKernel   # grid geometry and shape functions
+        self.centers     = (nCells, 2)     # cell centers (Cell.xm)
+        self.ux          = (nCells, 4)     # velocity field
+        self.uy          = (nCells, 4)     # velocity field
+        self.ax          = (nCells, 4)     # apparent acceleration field
+        self.ay          = (nCells, 4)     # apparent acceleration field
+        self.divVb       = (nCells,)       # enhanced field parameters
+        self.divVc       = (nCells,)
+        self.useEnhanced = False
+        self.time        = 0.0
+
+    methods:
+        def __init__(self, kernel, centers)
+        def setVelocity(self, ux, uy, divVb, divVc)
+        def setAcceleration(self, ax, ay)
+        def setEnhanced(self, useEnhanced=True)
+        def setTime(self, time)
+        def copy(self, out=None)                  # snapshot; into the arrays of out if given
+        def locate(self, X)                       # returns cell ids, clamped local coordinates, outside mask
+        def evaluate(self, X, a=0.0, gradients=True)
+        def interpolate(self, X, values, gradients=True)   # any cell-wise scalar field, e.g. pressure
+    '''
+
+    def __init__(self, kernel, centers):
+        '''
+        Constructor
+        '''
+        self.kernel  = kernel
+        self.centers = centers
+
+        nCells = len(centers)
+        self.ux    = zeros((nCells,4))
+        self.uy    = zeros((nCells,4))
+        self.ax    = zeros((nCells,4))
+        self.ay    = zeros((nCells,4))
+        self.divVb = zeros(nCells)
+        self.divVc = zeros(nCells)
+
+        self.useEnhanced = False
+        self.time = 0.0
+
+    def __str__(self):
+        return "AdvectionFields({}x{} cells, t={})".format(self.kernel.nCellsX, self.kernel.nCellsY, self.time)
+
+    def setVelocity(self, ux, uy, divVb, divVc):
+        self.ux    = ux
+        self.uy    = uy
+        self.divVb = divVb
+        self.divVc = divVc
+
+    def setAcceleration(self, ax, ay):
+        self.ax = ax
+        self.ay = ay
+
+    def setEnhanced(self, useEnhanced=True):
+        self.useEnhanced = useEnhanced
+
+    def setTime(self, time):
+        self.time = time
+
+    def copy(self, out=None):
+        if (out is None):
+            fields = AdvectionFields(self.kernel, self.centers)
+            fields.setVelocity(self.ux.copy(), self.uy.copy(), self.divVb.copy(), self.divVc.copy())
+            fields.setAcceleration(self.ax.copy(), self.ay.copy())
+        else:
+            # re-use the arrays of out (double buffering)
+            fields = out
+            for name in ('ux', 'uy', 'ax', 'ay', 'divVb', 'divVc'):
+                getattr(fields, name)[...] = getattr(self, name)
+        fields.setEnhanced(self.useEnhanced)
+        fields.setTime(self.time)
+        return fields
+
+    def locate(self, X):
+        # same cell search as Domain.findCell, for an (N,2) array of points
+        kernel = self.kernel
+        i = (X[:,0] / kernel.size[0]).astype(int)
+        j = (X[:,1] / kernel.size[1]).astype(int)
+        i = minimum(maximum(i, 0), kernel.nCellsX - 1)
+        j = minimum(maximum(j, 0), kernel.nCellsY - 1)
+        k = kernel.nCellsY*i + j
+
+        xl = 2*(X - self.centers[k]) / kernel.size
+        outside = ~(abs(xl) <= 1.0).all(axis=1)    # NaN positions count as outside
+
+        # Cell.setShape clamps to the cell
+        xl = minimum(maximum(xl, -1.0), 1.0)
+
+        return k, xl, outside
+
+    def evaluate(self, X, a=0.0, gradients=True):
+        '''
+        velocity + a * apparent acceleration at points X (N,2), and its gradient
+
+        returns (vel (N,2), grad (N,2,2) or None, number of points outside their cell)
+        '''
+        k, xl, outside = self.locate(X)
+        s = xl[:,0]
+        t = xl[:,1]
+        N, DNx, DNy = self.kernel.shapeFunctions(s, t)
+
+        ux = self.ux[k]
+        uy = self.uy[k]
+        ax = self.ax[k]
+        ay = self.ay[k]
+
+        vel = stack((einsum('nk,nk->n', N, ux), einsum('nk,nk->n', N, uy)), -1)
+        if (self.useEnhanced):
+            # add the enhanced velocity field
+            vel[:,0] += 0.5 * self.divVb[k] * (1. - s*s)
+            vel[:,1] += 0.5 * self.divVc[k] * (1. - t*t)
+
+        accel = stack((einsum('nk,nk->n', N, ax), einsum('nk,nk->n', N, ay)), -1)
+        vel += a * accel
+
+        if not gradients:
+            return vel, None, outside.sum()
+
+        gradV = stack((einsum('nk,nk->n', DNx, ux), einsum('nk,nk->n', DNy, ux),
+                       einsum('nk,nk->n', DNx, uy), einsum('nk,nk->n', DNy, uy)), -1)
+        gradA = stack((einsum('nk,nk->n', DNx, ax), einsum('nk,nk->n', DNy, ax),
+                       einsum('nk,nk->n', DNx, ay), einsum('nk,nk->n', DNy, ay)), -1)
+        grad = (gradV + a * gradA).reshape((-1,2,2))
+
+        return vel, grad, outside.sum()
+
+    def interpolate(self, X, values, gradients=True):
+        '''
+        cell-wise scalar field values (nCells, 4) at points X (N,2), and its gradient
+
+        returns (value (N,), grad (N,2) or None, number of points outside their cell)
+        '''
+        k, xl, outside = self.locate(X)
+        N, DNx, DNy = self.kernel.shapeFunctions(xl[:,0], xl[:,1])
+
+        v = values[k]
+        value = einsum('nk,nk->n', N, v)
+
+        if not gradients:
+            return value, None, outside.sum()
+
+        grad = stack((einsum('nk,nk->n', DNx, v), einsum('nk,nk->n', DNy, v)), -1)
+
+        return value, grad, outside.sum()
@@ -104,20 +104,75 @@ class MidPointMethod2(ButcherTableau):
         return array([1./2., 1./2.])  # update factors
 
 
-# class BogackiShampine(ButcherTableau):
-#
-#     def __init__(self):
-#         super().__init__()
-#
-#     def get_a(self):
-#         return array([0., 1./2., 3./4., 1.])        # time factors
-#
-#     def get_b(self):
-#         return array([[0., 0., 0., 0.],
-#                       [1./2., 0., 0, 0.],
-#                       [0., 3./4., 0., 0.],
-#                       [2./9., 1./3., 4./9., 0.]])     # position factors
-#
-#     def get_c(self):
-#         return array([[2./9.,	1./3.,	4./9.,	0.],
-#                      [7./.24,	1./.4,	1./.3,	1./.8]])  # update factors
+# Interface for an embedded pair: get_c gives the weights of the solution
+# that is propagated, get_c_hat those of the embedded solution of lower
+# order used for error estimation
+class EmbeddedButcherTableau(ButcherTableau):
+
+    @abstractmethod
+    def get_c_hat(self):
+        pass
+
+    @abstractmethod
+    def get_order(self):
+        pass                     # order of the embedded solution
+
+    def get_e(self):
+        return self.get_c() - self.get_c_hat()   # error factors
+
+
+class BogackiShampine(EmbeddedButcherTableau):
+
+    def __init__(self):
+        super().__init__()
+
+    def __str__(self):
+        return "BogackiShampine"
+
+    def get_a(self):
+        return array([0., 1./2., 3./4., 1.])        # time factors
+
+    def get_b(self):
+        return array([[0., 0., 0., 0.],
+                      [1./2., 0., 0, 0.],
+                      [0., 3./4., 0., 0.],
+                      [2./9., 1./3., 4./9., 0.]])     # position factors
+
+    def get_c(self):
+        return array([2./9., 1./3., 4./9., 0.])     # update factors (3rd order)
+
+    def get_c_hat(self):
+        return array([7./24., 1./4., 1./3., 1./8.]) # embedded update factors (2nd order)
+
+    def get_order(self):
+        return 2
+
+
+class DormandPrince(EmbeddedButcherTableau):
+
+    def __init__(self):
+        super().__init__()
+
+    def __str__(self):
+        return "DormandPrince"
+
+    def get_a(self):
+        return array([0., 1./5., 3./10., 4./5., 8./9., 1., 1.])                        # time factors
+
+    def get_b(self):
+        return array([[0., 0., 0., 0., 0., 0., 0.],
+                      [1./5., 0., 0., 0., 0., 0., 0.],
+                      [3./40., 9./40., 0., 0., 0., 0., 0.],
+                      [44./45., -56./15., 32./9., 0., 0., 0., 0.],
+                      [19372./6561., -25360./2187., 64448./6561., -212./729., 0., 0., 0.],
+                      [9017./3168., -355./33., 46732./5247., 49./176., -5103./18656., 0., 0.],
+                      [35./384., 0., 500./1113., 125./192., -2187./6784., 11./84., 0.]])   # position factors
+
+    def get_c(self):
+        return array([35./384., 0., 500./1113., 125./192., -2187./6784., 11./84., 0.])     # update factors (5th order)
+
+    def get_c_hat(self):
+        return array([5179./57600., 0., 7571./16695., 393./640., -92097./339200., 187./2100., 1./40.])   # embedded update factors (4th order)
+
+    def get_order(self):
+        return 4
@@ -6,13 +6,27 @@ Created on Nov 21, 2015
 from numpy import array, dot, cross, outer, tensordot, zeros, ones, sqrt, stack, mat, seterr
 from _operator import index
 
+from CellState import *
+from ShapeFunctions import *
+
 seterr(all='warn')
 
 class Cell(object):
     '''
+    The cell-local field copies (ux, uy, ax, ay, divVa, divVb, divVc) are
+    views onto one row of a CellState, so they can be set for all cells at once.
+    Gathers from the nodes are skipped while the epoch of the nodal field is
+    unchanged (only if all nodes of the cell share one GridState).
+    The Get... interpolation methods use the pure functions of
+    ShapeFunctions and do not modify the cell, so they may be called from
+    several threads once the cell fields are gathered.
+
     variables:
+        self.state  = CellState  # shared storage of cell-local fields
+        self.index  = id         # row in self.state
         self.id     = id
         self.nodes  = []
+        self.grid   = None       # GridState shared by all nodes, or None
         self.useEnhanced = False
         self.ux = zeros(4)    # velocity field
         self.uy = zeros(4)    # velocity field
@@ -27,23 +41,28 @@ class Cell(object):
         self.fHat = array([0.0,0.0])  # enhanced field forces
         self.mHat = array([0.0,0.0])  # enhanced field mass
         self.setShape(array([0.0,0.0]))
-        self.myParticles = []
+        self.particleIndex = None  # CellParticleIndex providing myParticles (None: the cell keeps a list)
+        self.myParticles           # particles in this cell
     
     methods:
-        def __init__(self, id)
+        def __init__(self, id, hx, hy, state=None)
         def __str__(self)
         def __repr__(self)
         def setParameters(self, density, viscosity)
         def setEnhanced(self, useEnhanced=True)
+        def setParticleIndex(self, index)      # take myParticles from a CellParticleIndex
         def addParticle(self, particle)
+        def addParticles(self, particles)      # particles must have their hostCell set already
+        def removeParticle(self, particle)
         def releaseParticles(self)
         def getLocal(self, x)
         def getGlobal(self, xl)
-        def setShape(self,xl)
+        def shapeAt(self, xl)                  # returns N, DNx, DNy at local coordinates xl (no side effects)
+        def setShape(self,xl)                  # stores shapeAt(xl) in self.shape, self.DshapeX, self.DshapeY
         def SetNodes(self, nds)
         def SetVelocity(self, u)
-        def updateCellVelocity(self)
-        def updateCellAcceleration(self)
+        def updateCellVelocity(self)           # returns True if the velocities were gathered
+        def updateCellAcceleration(self)       # returns True if the accelerations were gathered
         def GetVelocity(self, x)
         def GetApparentAccel(self, x)
         def SetPressure(self, p)
@@ -68,10 +87,18 @@ class Cell(object):
         def setCellGridCoordinates(self, i, j)
     '''
 
-    def __init__(self, id, hx, hy):
+    def __init__(self, id, hx, hy, state=None):
         '''
         Constructor
         '''
+        if (state is None):
+            # a stand-alone cell owns a state of a single cell
+            self.state = CellState(1)
+            self.index = 0
+        else:
+            self.state = state
+            self.index = id
+        
         self.id     = id
         self.gridCoordinates = ()
         self.nodes  = []
@@ -99,7 +126,8 @@ class Cell(object):
         
         self.setShape(array([0.0,0.0]))
         
-        self.myParticles = []
+        self.particleIndex = None
+        self.particleList  = []
 
     def __str__(self):
         s = "   cell({}): ({}/{}),({}/{}),({}/{}),({}/{})".format(self.id,
@@ -119,6 +147,74 @@ class Cell(object):
         return s
 
 
+    # cell-local fields are stored in the cell state
+    @property
+    def ux(self):
+        return self.state.ux[self.index]
+
+    @ux.setter
+    def ux(self, val):
+        self.state.ux[self.index] = val
+
+    @property
+    def uy(self):
+        return self.state.uy[self.index]
+
+    @uy.setter
+    def uy(self, val):
+        self.state.uy[self.index] = val
+
+    @property
+    def ax(self):
+        return self.state.ax[self.index]
+
+    @ax.setter
+    def ax(self, val):
+        self.state.ax[self.index] = val
+
+    @property
+    def ay(self):
+        return self.state.ay[self.index]
+
+    @ay.setter
+    def ay(self, val):
+        self.state.ay[self.index] = val
+
+    @property
+    def divVa(self):
+        return self.state.divVa[self.index]
+
+    @divVa.setter
+    def divVa(self, val):
+        self.state.divVa[self.index] = val
+
+    @property
+    def divVb(self):
+        return self.state.divVb[self.index]
+
+    @divVb.setter
+    def divVb(self, val):
+        self.state.divVb[self.index] = val
+
+    @property
+    def divVc(self):
+        return self.state.divVc[self.index]
+
+    @divVc.setter
+    def divVc(self, val):
+        self.state.divVc[self.index] = val
+
+    # particles are kept in a list, or taken from the host cells of a ParticleSet
+    @property
+    def myParticles(self):
+        if (self.particleIndex is None):
+            return self.particleList
+        return self.particleIndex.getViews(self.id)
+
+    def setParticleIndex(self, index):
+        self.particleIndex = index
+        self.particleList  = []
+
     def setParameters(self, density, viscosity):
         self.rho = density
         self.mu  = viscosity
@@ -127,7 +223,26 @@ class Cell(object):
         self.useEnhanced = useEnhanced
         
     def addParticle(self, particle):
-        self.myParticles.append(particle)
+        if (self.particleIndex is None):
+            self.particleList.append(particle)
+        else:
+            # the particle must be stored in the indexed set
+            self.particleIndex.pset.append(particle)
+            self.particleIndex.invalidate()
+        particle.hostCell = self.id
+        
+    def addParticles(self, particles):
+        if (self.particleIndex is None):
+            self.particleList.extend(particles)
+        else:
+            self.particleIndex.invalidate()
+        
+    def removeParticle(self, particle):
+        if (self.particleIndex is None):
+            self.particleList.remove(particle)
+        else:
+            self.particleIndex.invalidate()
+        particle.hostCell = -1
         
     def releaseParticles(self):
         listOfReleasedParticles = []
@@ -138,8 +253,12 @@ class Cell(object):
                 listOfLocalParticles.append(p)
             else:
                 listOfReleasedParticles.append(p)
+                p.hostCell = -1
         
-        self.myParticles = listOfLocalParticles
+        if (self.particleIndex is None):
+            self.particleList = listOfLocalParticles
+        elif (len(listOfReleasedParticles) > 0):
+            self.particleIndex.invalidate()
         
         return listOfReleasedParticles
     
@@ -151,18 +270,13 @@ class Cell(object):
         x = 0.5*xl*self.size + self.xm
         return x
     
-    def setShape(self,xl):
-
-        xl[0] = min( max(xl[0],-1.0), 1.0 )
-        xl[1] = min( max(xl[1],-1.0), 1.0 )
+    def shapeAt(self, xl):
+        return shapeFunctions(xl[0], xl[1], self.size)
 
-        sp = 0.5*(1. + xl[0])
-        sm = 0.5*(1. - xl[0])
-        tp = 0.5*(1. + xl[1])
-        tm = 0.5*(1. - xl[1])
-        self.shape   = array([ sm*tm, sp*tm, sp*tp, sm*tp ])
-        self.DshapeX = array([ -tm,  tm,  tp, -tp ]) / self.size[0]
-        self.DshapeY = array([ -sm, -sp,  sp,  sm ]) / self.size[1]
+    def setShape(self,xl):
+        # clamps xl in place
+        xl[:] = clampLocal(xl)
+        self.shape, self.DshapeX, self.DshapeY = self.shapeAt(xl)
     
     def SetNodes(self, nds):
         self.nodes = nds
@@ -170,6 +284,13 @@ class Cell(object):
         for node in nds:
             self.xm += 0.25*node.getPosition()
         
+        self.grid = nds[0].grid
+        for node in nds:
+            if (node.grid is not self.grid):
+                self.grid = None
+        self.state.velocityEpoch[self.index] = -1
+        self.state.accelEpoch[self.index]    = -1
+        
     def GetNodeIndexes(self):
         indexes = []
         for node in self.nodes:
@@ -178,7 +299,8 @@ class Cell(object):
         
     def SetVelocity(self):
 
-        self.updateCellVelocity()
+        if not self.updateCellVelocity():
+            return    # divergence terms are still current
         
         self.divVa =  0.5*(-self.ux[0] + self.ux[1] + self.ux[2] - self.ux[3]) / self.size[0]
         self.divVa += 0.5*(-self.uy[0] - self.uy[1] + self.uy[2] + self.uy[3]) / self.size[1]
@@ -191,6 +313,14 @@ class Cell(object):
 
     def updateCellVelocity(self):
 
+        if (self.grid != None):
+            epoch = self.grid.velocityEpoch
+            if (self.state.velocityEpoch[self.index] == epoch):
+                self.state.avoidedGatherCount += 1
+                return False
+        else:
+            epoch = -1
+
         self.ux = zeros(4)
         self.uy = zeros(4)
 
@@ -199,8 +329,20 @@ class Cell(object):
             self.ux[i] = vel[0]
             self.uy[i] = vel[1]
 
+        self.state.velocityEpoch[self.index] = epoch
+        self.state.gatherCount += 1
+        return True
+
     def updateCellAcceleration(self):
 
+        if (self.grid != None):
+            epoch = self.grid.accelEpoch
+            if (self.state.accelEpoch[self.index] == epoch):
+                self.state.avoidedGatherCount += 1
+                return False
+        else:
+            epoch = -1
+
         self.ax = zeros(4)
         self.ay = zeros(4)
 
@@ -209,10 +351,14 @@ class Cell(object):
             self.ax[i] = accel[0]
             self.ay[i] = accel[1]
 
+        self.state.accelEpoch[self.index] = epoch
+        self.state.gatherCount += 1
+        return True
+
     def GetVelocity(self, x):
-        xl = self.getLocal(x)
-        self.setShape(xl)
-        vel = array([dot(self.shape, self.ux), dot(self.shape, self.uy)])
+        xl = clampLocal(self.getLocal(x))
+        N, DNx, DNy = self.shapeAt(xl)
+        vel = array([dot(N, self.ux), dot(N, self.uy)])
 
         # self.useEnhanced = False
         if (self.useEnhanced):
@@ -226,15 +372,13 @@ class Cell(object):
     def GetApparentAccel(self, x):
         self.updateCellAcceleration()
 
-        xl = self.getLocal(x)
-        self.setShape(xl)
-        accel = array([dot(self.shape, self.ax), dot(self.shape, self.ay)])
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
+        accel = array([dot(N, self.ax), dot(N, self.ay)])
             
         return accel
 
     def GetAcceleration(self, x):
-        xl = self.getLocal(x)
-        self.setShape(xl)
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
         ax = zeros((4,))
         ay = zeros((4,))
         for i in range(4):
@@ -242,7 +386,7 @@ class Cell(object):
             mass = self.nodes[i].getMass()
             ax[i] = nodalforce[0]/ mass
             ay[i] = nodalforce[1]/ mass
-        accn = array([dot(self.shape, ax), dot(self.shape, ay)])
+        accn = array([dot(N, ax), dot(N, ay)])
             
         return accn
 
@@ -250,47 +394,43 @@ class Cell(object):
         self.p = p
 
     def GetPressure(self, x):
-        xl = self.getLocal(x)
-        self.setShape(xl)
-        return dot(self.shape, self.p)
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
+        return dot(N, self.p)
     
     def GetGradientP(self, x):
-        xl = self.getLocal(x)
-        self.setShape(xl)
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
         
-        return array([dot(self.DshapeX,self.p), dot(self.DshapeY,self.p) ])
+        return array([dot(DNx,self.p), dot(DNy,self.p) ])
 
     def GetGradientV(self, x):
-        xl = self.getLocal(x)
-        self.setShape(xl)
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
 
-        dxu = dot(self.DshapeX, self.ux)
-        dyu = dot(self.DshapeY, self.ux)
-        dxv = dot(self.DshapeX, self.uy)
-        dyv = dot(self.DshapeY, self.uy)
+        dxu = dot(DNx, self.ux)
+        dyu = dot(DNy, self.ux)
+        dxv = dot(DNx, self.uy)
+        dyv = dot(DNy, self.uy)
 
         return array([[dxu, dyu],[dxv, dyv]])
 
     def GetGradientA(self, x):
         self.updateCellAcceleration()
 
-        xl = self.getLocal(x)
-        self.setShape(xl)
+        N, DNx, DNy = self.shapeAt(clampLocal(self.getLocal(x)))
         
-        dxax = dot(self.DshapeX, self.ax)
-        dyax = dot(self.DshapeY, self.ax)
-        dxay = dot(self.DshapeX, self.ay)
-        dyay = dot(self.DshapeY, self.ay)
+        dxax = dot(DNx, self.ax)
+        dyax = dot(DNy, self.ax)
+        dxay = dot(DNx, self.ay)
+        dyay = dot(DNy, self.ay)
             
         return array([[dxax, dyax],[dxay, dyay]])
     
     def GetStrainRate(self, xl):
-        self.setShape(xl)
+        N, DNx, DNy = self.shapeAt(clampLocal(xl))
         
-        dxu = dot(self.DshapeX, self.ux)
-        dyu = dot(self.DshapeY, self.ux)
-        dxv = dot(self.DshapeX, self.uy)
-        dyv = dot(self.DshapeY, self.uy)
+        dxu = dot(DNx, self.ux)
+        dyu = dot(DNy, self.ux)
+        dxv = dot(DNx, self.uy)
+        dyv = dot(DNy, self.uy)
 
         #return array([dxu, dyv, dyu+dxv])
         
@@ -325,6 +465,7 @@ class Cell(object):
         for s in gpts:
             for t in gpts:
                 xl = array([s,t])
+                N, DNx, DNy = self.shapeAt(xl)
                 dh   = self.GetStrainRate(xl)
                 
                 if (self.useEnhanced):
@@ -337,8 +478,8 @@ class Cell(object):
                 d12 = w*     self.mu * ( dh[2] + denh[2] )
                 d21 = d12
                 
-                dfx = d11*self.DshapeX + d12*self.DshapeY
-                dfy = d21*self.DshapeX + d22*self.DshapeY
+                dfx = d11*DNx + d12*DNy
+                dfy = d21*DNx + d22*DNy
                 
                 forces -= stack((dfx,dfy),-1)
                 
@@ -346,14 +487,14 @@ class Cell(object):
                     
                     aTransient = zeros(2)
         
-                    dxu = dot(self.DshapeX, self.ux)
-                    dyu = dot(self.DshapeY, self.ux)
-                    dxv = dot(self.DshapeX, self.uy)
-                    dyv = dot(self.DshapeY, self.uy)
+                    dxu = dot(DNx, self.ux)
+                    dyu = dot(DNy, self.ux)
+                    dxv = dot(DNx, self.uy)
+                    dyv = dot(DNy, self.uy)
                     
                     # add  w . (grad v) . v
-                    vx = dot(self.shape, self.ux)
-                    vy = dot(self.shape, self.uy)
+                    vx = dot(N, self.ux)
+                    vy = dot(N, self.uy)
                     # standard tensor (single) dot product
                     try:
                         aTransient[0] = dxu * vx + dyu * vy
@@ -365,7 +506,7 @@ class Cell(object):
                         print(vy)
                         raise
 
-                    fTransient = w * self.rho * tensordot(self.shape, aTransient, axes=0)  # tensor product
+                    fTransient = w * self.rho * tensordot(N, aTransient, axes=0)  # tensor product
                     
                     forces -= fTransient
                 
@@ -382,10 +523,9 @@ class Cell(object):
         
         for s in gpts:
             for t in gpts:
-                xl = array([s,t])
-                self.setShape(xl)
+                N, DNx, DNy = self.shapeAt(array([s,t]))
                 
-                B = stack((self.DshapeX,self.DshapeY))
+                B = stack((DNx,DNy))
                 
                 Ke += w*tensordot(B, B, ([0,0]))
         
@@ -402,11 +542,11 @@ class Cell(object):
         for s in gpts:
             for t in gpts:
                 xl = array([s,t])
-                self.setShape(xl)
+                N, DNx, DNy = self.shapeAt(xl)
                 
                 divV = self.divVa + self.divVb*xl[0] + self.divVc*xl[1]
                 
-                Fe += -w*self.shape*divV
+                Fe += -w*N*divV
         
         return Fe
     
@@ -435,9 +575,8 @@ class Cell(object):
         
         for s in gpts:
             for t in gpts:
-                xl = array([s,t])
-                self.setShape(xl)
-                mass += w*self.shape
+                N, DNx, DNy = self.shapeAt(array([s,t]))
+                mass += w*N
                 
         for i in range(4):
             self.nodes[i].addMass(mass[i])
@@ -454,10 +593,9 @@ class Cell(object):
         
         for s in gpts:
             for t in gpts:
-                xl = array([s,t])
-                self.setShape(xl)
-                vel = tensordot(nodalV, self.shape, ([1,0])) 
-                momentum += w*self.shape*vel
+                N, DNx, DNy = self.shapeAt(array([s,t]))
+                vel = tensordot(nodalV, N, ([1,0])) 
+                momentum += w*N*vel
                 
         for i in range(4):
             self.nodes[i].addMomentum(momentum[i])
@@ -0,0 +1,96 @@
+from numpy import zeros, bincount, cumsum, argsort, int64, uint16
+
+
+class CellParticleIndex(object):
+    '''
+    Compressed (CSR) map from cells to the particles they hold.
+
+    self.order lists particle slots sorted by host cell; the slots of the
+    particles in cell k are self.order[self.offsets[k]:self.offsets[k+1]].
+    Particles without a host cell (-1) are not indexed.
+
+    The index may be bound to a ParticleSet: it is then rebuilt from the
+    host cells of the set on the first query after invalidate(), and
+    provides the particles of a cell as views (Cell.myParticles).
+
+    On a rebuild the offsets come from the cell counts (bincount, cumsum),
+    and the slots are ordered by stable argsort passes over the 16-bit
+    halves of the cell ids (one pass for up to 65536 cells).  The result
+    holds for any stable sort; numpy currently sorts 16-bit keys by radix
+    sort, which makes a rebuild linear in the number of particles.
+
+    variables:
+        self.nCells
+        self.counts  = (nCells,)     # particles per cell
+        self.offsets = (nCells+1,)
+        self.order   = (nIndexed,)   # particle slots sorted by cell
+        self.pset    = ParticleSet   # set the index is bound to, or None
+        self.current # False if the host cells of self.pset changed since the last rebuild
+
+    methods:
+        def __init__(self, nCells)
+        def rebuild(self, hostCells)
+        def setParticleSet(self, pset)
+        def invalidate(self)          # host cells or slots of the bound set have changed
+        def update(self)              # rebuild from the bound set if outdated; returns self
+        def getViews(self, k)         # Particle views of the particles in cell k
+        def getCounts(self)
+        def getParticles(self, k)     # slots of the particles in cell k
+        def __iter__(self)            # (k, slots) for all cells
+    '''
+
+    def __init__(self, nCells):
+        '''
+        Constructor
+        '''
+        self.nCells  = nCells
+        self.counts  = zeros(nCells, dtype=int64)
+        self.offsets = zeros(nCells+1, dtype=int64)
+        self.order   = zeros(0, dtype=int64)
+        self.pset    = None
+        self.current = True
+
+    def __str__(self):
+        return "CellParticleIndex({} particles in {} cells)".format(len(self.order), self.nCells)
+
+    def rebuild(self, hostCells):
+        indexed = (hostCells >= 0).nonzero()[0]
+        host    = hostCells[indexed]
+
+        self.counts = bincount(host, minlength=self.nCells)
+        self.offsets[0]  = 0
+        self.offsets[1:] = cumsum(self.counts)
+
+        # stable sort by the low and then the high 16 bits of the cell id
+        # (numpy picks radix sort for 16-bit keys; any stable sort is correct)
+        order = argsort((host & 0xFFFF).astype(uint16), kind='stable')
+        if (self.nCells > 1<<16):
+            order = order[argsort((host[order] >> 16).astype(uint16), kind='stable')]
+        self.order = indexed[order]
+
+    def setParticleSet(self, pset):
+        self.pset = pset
+        self.invalidate()
+
+    def invalidate(self):
+        self.current = False
+
+    def update(self):
+        if (not self.current and self.pset is not None):
+            self.rebuild(self.pset.getHostCells())
+        self.current = True
+        return self
+
+    def getViews(self, k):
+        self.update()
+        return [self.pset.view(slot) for slot in self.getParticles(k)]
+
+    def getCounts(self):
+        return self.counts
+
+    def getParticles(self, k):
+        return self.order[self.offsets[k]:self.offsets[k+1]]
+
+    def __iter__(self):
+        for k in range(self.nCells):
+            yield k, self.getParticles(k)
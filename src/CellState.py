@@ -0,0 +1,97 @@
+from numpy import zeros, ones, int64
+
+
+class CellState(object):
+    '''
+    Contiguous storage of the cell-local copies of nodal fields.
+
+    Each cell keeps the nodal velocity and apparent acceleration of its four
+    corner nodes, as gathered by Cell.SetVelocity / updateCellAcceleration,
+    and the divergence terms of its enhanced velocity field.  Arrays are
+    indexed by cell id.
+
+    Each row remembers the GridState epoch it was gathered at, so a gather
+    is skipped while the nodal field has not changed.  gatherCount and
+    avoidedGatherCount count cell gathers performed and skipped.
+
+    variables:
+        self.nCells
+        self.ux    = zeros((nCells,4))    # velocity field
+        self.uy    = zeros((nCells,4))    # velocity field
+        self.ax    = zeros((nCells,4))    # apparent acceleration field
+        self.ay    = zeros((nCells,4))    # apparent acceleration field
+        self.divVa = zeros(nCells)
+        self.divVb = zeros(nCells)
+        self.divVc = zeros(nCells)
+        self.velocityEpoch = -ones(nCells)   # epoch of the gathered velocity
+        self.accelEpoch    = -ones(nCells)   # epoch of the gathered acceleration
+        self.gatherCount
+        self.avoidedGatherCount
+
+    methods:
+        def __init__(self, nCells=1)
+        def setVelocity(self, ux, uy, divVa, divVb, divVc, epoch=-1)
+        def setAcceleration(self, ax, ay, epoch=-1)
+        def isVelocityCurrent(self, epoch)
+        def isAccelCurrent(self, epoch)
+        def getGatherStatistics(self)
+        def resetGatherStatistics(self)
+    '''
+
+    def __init__(self, nCells=1):
+        '''
+        Constructor
+        '''
+        self.nCells = nCells
+
+        self.ux = zeros((nCells,4))
+        self.uy = zeros((nCells,4))
+
+        self.ax = zeros((nCells,4))
+        self.ay = zeros((nCells,4))
+
+        self.divVa = zeros(nCells)
+        self.divVb = zeros(nCells)
+        self.divVc = zeros(nCells)
+
+        self.velocityEpoch = -ones(nCells, dtype=int64)
+        self.accelEpoch    = -ones(nCells, dtype=int64)
+
+        self.resetGatherStatistics()
+
+    def __str__(self):
+        return "CellState({} cells)".format(self.nCells)
+
+    def setVelocity(self, ux, uy, divVa, divVb, divVc, epoch=-1):
+        self.ux[:] = ux
+        self.uy[:] = uy
+        self.divVa[:] = divVa
+        self.divVb[:] = divVb
+        self.divVc[:] = divVc
+        self.velocityEpoch[:] = epoch
+        self.gatherCount += self.nCells
+
+    def setAcceleration(self, ax, ay, epoch=-1):
+        self.ax[:] = ax
+        self.ay[:] = ay
+        self.accelEpoch[:] = epoch
+        self.gatherCount += self.nCells
+
+    def isVelocityCurrent(self, epoch):
+        if (self.velocityEpoch == epoch).all():
+            self.avoidedGatherCount += self.nCells
+            return True
+        return False
+
+    def isAccelCurrent(self, epoch):
+        if (self.accelEpoch == epoch).all():
+            self.avoidedGatherCount += self.nCells
+            return True
+        return False
+
+    def getGatherStatistics(self):
+        return {'gathers':self.gatherCount, 'avoided':self.avoidedGatherCount}
+
+    def resetGatherStatistics(self):
+        self.gatherCount        = 0
+        self.avoidedGatherCount = 0
@@ -4,11 +4,27 @@ Created on June 10, 2018
 @author: pmackenz
 ''' 
 
+from GridState import *
 from Node import *
 from Cell import *
+from CellState import *
+from ElementKernel import *
 from matrixDataType import *
+from PressureSolver import *
 
 from Particle import *
+from ParticleSet import *
+from ParticleAdvector import *
+from AdvectionFields import *
+from HostCellLocator import *
+from CellParticleIndex import *
+from ParticleOrdering import *
+from TracerInjector import *
+from MappedParticleSet import *
+from SharedParticleSet import *
+from ParallelAdvector import *
+from FieldInterpolator import *
+from AdaptiveParticleAdvector import *
 
 from Writer import *
 from Plotter2 import *
@@ -16,11 +32,14 @@ from Plotter2 import *
 from Errors import *
 from ButcherTableau import *
 
-from numpy import array, dot, zeros, linspace, meshgrid, abs, ceil
+from numpy import array, dot, zeros, linspace, meshgrid, abs, ceil, asarray, inf
+import numpy as np
 from numpy.linalg import solve
 from scipy.sparse.linalg import spsolve
 
 from time import process_time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from ParticleTracePlot import *
 
@@ -36,9 +55,31 @@ class Domain(object):
         self.Y 
         self.hx        # cell size in x-direction
         self.hy        # cell size in y-direction
-        self.nodes 
+        self.grid      # GridState holding all nodal fields as arrays
+        self.nodes     # nodes[i][j] are views onto self.grid
         self.cells 
-        self.particles
+        self.cellState # CellState holding the cell-local field copies as arrays
+        self.kernel    # ElementKernel for batched cell operations
+        self.assembler # SparseAssembler for global operators (built on first use)
+        self.particles # ParticleSet; iterating it yields Particle views
+                       # (a property: waits for a pipelined particle update first)
+        self.particleSet # the ParticleSet behind self.particles
+        self.fields    # AdvectionFields seen by the particles
+        self.advector  # ParticleAdvector (batched Runge-Kutta update), ParallelAdvector or AdaptiveParticleAdvector
+        self.locator   # HostCellLocator keeping particle host cells current
+        self.cellIndex # CellParticleIndex: particle slots by cell, rebuilt on demand after particles moved;
+                       # Cell.myParticles are taken from it
+        self.ordering  # ParticleOrdering: periodic space-filling-curve sort of particle storage
+        self.injectors # TracerInjectors releasing particles every step
+        self.retireAtWalls = False
+        self.wallTolerance = 0.0
+        self.batchedAdvection = True
+        self.pipelined     ... particle update of step n runs on a worker thread during the grid solve of step n+1
+        self.pipeline      ... ThreadPoolExecutor with one worker thread (None unless pipelined)
+        self.pendingParticleUpdate ... Future of the particle update in progress, or None
+        self.pipelineThread ... thread running the pipelined particle update
+        self.fieldBuffers  ... two AdvectionFields snapshots used alternately by the pipeline
+        self.outsideCount  ... points outside their cell in the last findCells()
 
         self.analysisControl
         self.plotControl
@@ -53,6 +94,8 @@ class Domain(object):
 
         self.motion                 ... manufactured solution for testing
         self.particleUpdateScheme   ... the timeIntegrator
+        self.fixedStepScheme        ... timeIntegrator to restore when adaptive advection is turned off
+        self.pressureSolver         ... caches and solves the pressure operator
 
         self.lastWrite    ... time of the last output
         self.lastPlot     ... time of the last plot
@@ -63,6 +106,13 @@ class Domain(object):
         def __init__(self, width=1., height=1., nCellsX=2, nCellsY=2)
         def __str__(self)
         def setTimeIntegrator(self, integrator)
+        def setPressureSolver(self, solver)
+        def getPressurePin(self)            # dof of the node with prescribed pressure
+        def getPressureOperatorKey(self)    # identifies grid and pressure BC of the operator
+        def getAssembler(self)              # sparse assembler with the element-to-CSR map of this mesh
+        def gatherCellVelocity(self)        # Cell.SetVelocity for all cells at once
+        def gatherCellAcceleration(self)    # Cell.updateCellAcceleration for all cells at once
+        def getGatherStatistics(self)       # number of cell gathers performed and avoided
         def setMotion(self, motion)
         def setBoundaryConditions(self)
         def setPlotInterval(self, dt)
@@ -79,16 +129,50 @@ class Domain(object):
         def solveVtilde(self, dt)
         def solveVenhanced(self, dt)
         def updateParticleStress(self)
-        def updateParticleMotion(self)
+        def updateParticleMotion(self, dt)
+        def finishParticleMotion(self, time, dt)       # traces, relocation and re-ordering after the advection
+        def advanceParticles(self, fields, time, dt)   # particle phase of a step on the given fields
+        def setPipelinedExecution(self, OnOff=True)
+        def finishParticleUpdate(self)      # wait for a pipelined particle update (called by all particle methods)
+        def updateParticleMotionSerial(self, dt)   # per-particle reference for updateParticleMotion
+        def getAdvectionFields(self)
+        def getCellPressure(self)              # nodal pressure per cell (nCells, 4), for AdvectionFields.interpolate
+        def getInterpolator(self, nThreads=4, blockSize=16384)   # FieldInterpolator on the current fields
+        def setBatchedAdvection(self, OnOff=True)
+        def setParallelAdvection(self, nWorkers)   # advect on nWorkers processes (1 = in this process);
+                                                   # moves the particles into a SharedParticleSet if needed
+        def setAdaptiveAdvection(self, tolerance, scheme=None)   # per-particle sub-steps; tolerance=None turns it off
+                                                   # (adaptive and parallel advection exclude each other)
         def findCell(self, x)
+        def findCells(self, X, strict=False)   # batched findCell: returns cell ids and local coordinates
+        def relocateParticles(self)            # update host cells after particles moved
+        def getLocatorStatistics(self)
+        def setParticleSet(self, pset)         # e.g. a MappedParticleSet for out-of-core particles
+        def setParticleChunkSize(self, chunkSize)        # particles advanced and relocated at a time (None = all)
+        def getAdvectionStatistics(self)                 # particle updates, seconds and particles per second
+        def registerParticles(self, slots)     # new particles with known host cells were added
+        def setParticleReordering(self, interval, curve='morton')   # interval=0 turns re-ordering off
+        def reorderParticles(self, curve=None)
+        def getCellIndex(self)
+        def getParticlesInCell(self, k)        # slots of the particles in cell k
+        def getCellOccupancy(self)             # number of particles per cell
+        def seedParticles(self, n, m, cells=None, pattern='regular', region=None, seed=None)
         def createParticles(self, n, m)     # Default particle creator that generates particles in all cells
         def createParticlesMID(self, n, m)  # Particle creator that generates particle only in the middle cell
         def createParticleAtX(self, mp, xp) # Particle creator that generates a single particle of mass mp at position xp 
+        def createParticlesAtX(self, mp, X) # createParticleAtX for an (N,2) array of positions; returns the slots
+        def removeParticles(self, slots)
+        def addInjector(self, injector)
+        def setWallRetirement(self, OnOff=True, tolerance=0.0)
+        def retireParticles(self, time)     # remove particles past their lifetime or at a wall
+        def injectParticles(self, time, dt, fields=None)   # release tracers and advance them to time+dt
+        def updateTracers(self, time, dt, fields=None)     # retire and inject tracer particles after a step
         def getTimeStep(self, CFL)
         def plotData(self)
         def writeData(self)
         def setMotion(self, dt=0.0)
         def particleTrace(self, OnOff)      # turn particle trace on and off
+        def setTraceStorage(self, capacity, stride=1, window=None)
         def computeCellFlux(self)
     '''
 
@@ -121,6 +205,11 @@ class Domain(object):
         self.v0  = 0.0
         self.motion = None
         self.particleUpdateScheme = ExplicitEuler()
+        self.fixedStepScheme = None
+        self.pressureSolver = DirectPressureSolver()
+        
+        self.grid = GridState(nCellsX+1, nCellsY+1)
+        self.grid.setCoordinates(x, y)
         
         self.nodes = [ [ None for j in range(self.nCellsY+1) ] for i in range(self.nCellsX+1) ]
         id = -1
@@ -128,10 +217,12 @@ class Domain(object):
         for i in range(nCellsX+1):
             for j in range(nCellsY+1):
                 id += 1
-                theNode = Node(id,x[i],y[j])
+                theNode = Node(id,x[i],y[j],self.grid,i,j)
                 theNode.setGridCoordinates(i,j)
                 self.nodes[i][j] = theNode
                 
+        self.cellState = CellState(nCellsX*nCellsY)
+        
         self.cells = []
         id = -1
         hx = width / nCellsX
@@ -140,7 +231,7 @@ class Domain(object):
         for i in range(nCellsX):
             for j in range(nCellsY):
                 id += 1
-                newCell = Cell(id, hx, hy)
+                newCell = Cell(id, hx, hy, self.cellState)
                 newCell.setCellGridCoordinates(i, j)
                 theNodes = []
                 theNodes.append(self.nodes[i][j])
@@ -150,9 +241,31 @@ class Domain(object):
                 newCell.SetNodes(theNodes)
                 self.cells.append(newCell)
         
+        self.kernel = ElementKernel(hx, hy, nCellsX, nCellsY)
+        self.assembler = None
+        
+        self.fields = AdvectionFields(self.kernel, array([cell.xm for cell in self.cells]))
+        self.advector = ParticleAdvector(self.particleUpdateScheme)
+        self.locator  = HostCellLocator(self.fields)
+        self.cellIndex = CellParticleIndex(nCellsX*nCellsY)
+        self.ordering = ParticleOrdering(nCellsX, nCellsY)
+        self.injectors = []
+        self.retireAtWalls = False
+        self.wallTolerance = 0.0
+        self.batchedAdvection = True
+        self.pipelined = False
+        self.pipeline  = None
+        self.pendingParticleUpdate = None
+        self.pipelineThread = None
+        self.fieldBuffers = []
+        self.outsideCount = 0
+        
         self.setParameters(self.Re, self.rho, self.v0)
         
-        self.particles = []
+        self.particles = ParticleSet()
+        self.cellIndex.setParticleSet(self.particles)
+        for cell in self.cells:
+            cell.setParticleIndex(self.cellIndex)
 
         # set default analysis parameters
         self.setAnalysis(False, True, True, True, False, True, True, True)
@@ -171,6 +284,17 @@ class Domain(object):
         self.writer.setGrid(width, height, nCellsX, nCellsY)
         self.lastWrite = self.time
         
+    # the particles are only handed out once a pipelined update has finished
+    @property
+    def particles(self):
+        self.finishParticleUpdate()
+        return self.particleSet
+
+    @particles.setter
+    def particles(self, pset):
+        self.finishParticleUpdate()
+        self.particleSet = pset
+
     def __str__(self):
         s = "==== D O M A I N ====\n"
         s += "Nodes:\n"
@@ -183,13 +307,109 @@ class Domain(object):
         return s
 
     def particleTrace(self, OnOff):
+        self.finishParticleUpdate()
         self.recordParticleTrace = OnOff
-        for particle in self.particles:
-            particle.trace(OnOff)
+        self.particles.trace(OnOff)
+
+    def setTraceStorage(self, capacity, stride=1, window=None):
+        self.finishParticleUpdate()
+        # keep at most capacity frames (None = all), recorded every stride steps;
+        # traces are limited to the last window seconds (None = all stored frames)
+        store = self.particles.trajectories
+        store.setCapacity(capacity)
+        store.setStride(stride)
+        store.setWindow(window)
 
     def setTimeIntegrator(self, integrator):
+        self.finishParticleUpdate()
+        # the advector rejects schemes it cannot use, before anything is changed
+        self.advector.setTimeIntegrator(integrator)
         self.particleUpdateScheme = integrator
 
+    def setBatchedAdvection(self, OnOff=True):
+        # False selects the per-particle reference implementation
+        self.batchedAdvection = OnOff
+
+    def setAdaptiveAdvection(self, tolerance, scheme=None):
+        self.finishParticleUpdate()
+        # scheme must be an EmbeddedButcherTableau; it replaces the time integrator
+        # until adaptive advection is turned off again
+        chunkSize = self.advector.chunkSize
+
+        if (tolerance is None):
+            if isinstance(self.advector, AdaptiveParticleAdvector):
+                self.particleUpdateScheme = self.fixedStepScheme
+                self.fixedStepScheme = None
+                self.advector = ParticleAdvector(self.particleUpdateScheme, chunkSize)
+            return
+
+        if isinstance(self.advector, ParallelAdvector):
+            raise ValueError("adaptive advection does not run on worker processes; call setParallelAdvection(1) first")
+
+        if (scheme is None):
+            scheme = self.particleUpdateScheme
+            if not isinstance(scheme, EmbeddedButcherTableau):
+                scheme = DormandPrince()
+        self.advector = AdaptiveParticleAdvector(scheme, tolerance, chunkSize)
+        if (self.fixedStepScheme is None):
+            self.fixedStepScheme = self.particleUpdateScheme
+        self.particleUpdateScheme = scheme
+
+    def setParallelAdvection(self, nWorkers):
+        self.finishParticleUpdate()
+        chunkSize = self.advector.chunkSize
+
+        if (nWorkers > 1):
+            if isinstance(self.advector, AdaptiveParticleAdvector):
+                raise ValueError("adaptive advection does not run on worker processes; call setAdaptiveAdvection(None) first")
+            if isinstance(self.advector, ParallelAdvector):
+                self.advector.setWorkers(nWorkers)
+                return
+            self.advector = ParallelAdvector(self.particleUpdateScheme, nWorkers, chunkSize)
+            if (self.particles.getBlock('position') is None):
+                # the workers advance the particles in place; views of the old set are not moved along
+                self.setParticleSet(self.particles.copy(SharedParticleSet()))
+        elif isinstance(self.advector, ParallelAdvector):
+            self.advector.close()
+            self.advector = ParticleAdvector(self.particleUpdateScheme, chunkSize)
+
+    def setPressureSolver(self, solver):
+        self.pressureSolver = solver
+
+    def getPressurePin(self):
+        i = self.nCellsX // 2
+        return i + self.nCellsY*(self.nCellsX+1)
+
+    def getPressureOperatorKey(self):
+        return (self.nCellsX, self.nCellsY, self.hx, self.hy, self.getPressurePin())
+
+    def getAssembler(self):
+        if (self.assembler == None):
+            ndof = (self.nCellsX+1)*(self.nCellsY+1)
+            self.assembler = SparseAssembler(ndof, self.kernel.cellNodes)
+        return self.assembler
+
+    def gatherCellVelocity(self):
+        epoch = self.grid.velocityEpoch
+        if self.cellState.isVelocityCurrent(epoch):
+            return
+        
+        vel = self.kernel.gather(self.grid.getVelocity())
+        ux = vel[:,:,0]
+        uy = vel[:,:,1]
+        self.cellState.setVelocity(ux, uy, *self.kernel.cellDivergence(ux, uy), epoch)
+
+    def gatherCellAcceleration(self):
+        epoch = self.grid.accelEpoch
+        if self.cellState.isAccelCurrent(epoch):
+            return
+        
+        accel = self.kernel.gather(self.grid.appAccel)
+        self.cellState.setAcceleration(accel[:,:,0], accel[:,:,1], epoch)
+
+    def getGatherStatistics(self):
+        return self.cellState.getGatherStatistics()
+
     def setMotion(self, motion):
         self.motion = motion
 
@@ -203,25 +423,27 @@ class Domain(object):
         
     def setBoundaryConditions(self):
         
-        nCellsX = self.nCellsX
-        nCellsY = self.nCellsY
+        # the pressure operator has to be rebuilt for new boundary conditions
+        self.pressureSolver.invalidate()
         
         # define fixities
-        for i in range(nCellsX+1):
-            self.nodes[i][0].fixDOF(1, 0.0)
-            self.nodes[i][nCellsY].fixDOF(1, 0.0)
-            
-            #self.nodes[i][0].fixDOF(0, 0.0)             # fully fixed
-            #self.nodes[i][nCellsY].fixDOF(0, 0.0)       # fully fixed
-            
-            if (i>0 and i< nCellsX+1):
-                self.nodes[i][nCellsY].fixDOF(0, self.v0)
-        for j in range(nCellsY+1):
-            self.nodes[0][j].fixDOF(0, 0.0)
-            self.nodes[nCellsX][j].fixDOF(0, 0.0)
+        grid = self.grid
+        
+        grid.fixed[0,:,1]       = True    # bottom: v_y = 0
+        grid.fixedValue[0,:,1]  = 0.0
+        grid.fixed[-1,:,1]      = True    # top: v_y = 0
+        grid.fixedValue[-1,:,1] = 0.0
+        
+        grid.fixed[-1,1:,0]      = True   # top: sliding lid v_x = v0
+        grid.fixedValue[-1,1:,0] = self.v0
+        
+        grid.fixed[:,0,0]       = True    # left: v_x = 0
+        grid.fixedValue[:,0,0]  = 0.0
+        grid.fixed[:,-1,0]      = True    # right: v_x = 0 (including the top corner)
+        grid.fixedValue[:,-1,0] = 0.0
             
-            #self.nodes[0][j].fixDOF(1, 0.0)             # fully xixed
-            #self.nodes[nCellsX][j].fixDOF(1, 0.0)       # fully fixed       
+        #grid.fixed[[0,-1],:,0] = True             # fully fixed
+        #grid.fixed[:,[0,-1],1] = True             # fully fixed
 
 
     def setAnalysis(self, doInit, solveVstar, solveP, solveVtilde, solveVenhanced, updatePosition, updateStress, addTransient):
@@ -256,6 +478,10 @@ class Domain(object):
             
         viscosity = density * velocity * L / Re
         
+        # nodal mass depends on density and the mesh only
+        if (self.grid.getLumpedMass() is None or density != self.rho):
+            self.grid.setLumpedMass(self.kernel.computeLumpedMass(density))
+        
         self.Re  = Re
         self.rho = density
         self.v0  = velocity
@@ -267,21 +493,16 @@ class Domain(object):
             cell.setParameters(density, viscosity)
        
     def setInitialState(self):
-        for nodeList in self.nodes:
-            for node in nodeList:
-                node.wipe()
-        
-        for cell in self.cells:
-            cell.mapMassToNodes()
+        # wipe resets the nodal mass to the cached lumped mass
+        self.grid.wipe()
         
         # initial condition at nodes define v*, not v
-        for i in range(self.nCellsX+1):
-            for j in range(self.nCellsY):
-                self.nodes[i][j].setVelocity(zeros(2))
-            self.nodes[i][self.nCellsY].setVelocity(array([self.v0 ,0.0]))
+        vel = zeros((self.nCellsY+1, self.nCellsX+1, 2))
+        vel[self.nCellsY,:,0] = self.v0
         # fix the top corner nodes
-        self.nodes[0][self.nCellsY].setVelocity(zeros(2))
-        self.nodes[self.nCellsX][self.nCellsY].setVelocity(zeros(2))
+        vel[self.nCellsY, 0,0] = 0.0
+        vel[self.nCellsY,-1,0] = 0.0
+        self.grid.setVelocity(vel)
         
         # now find pressure for a fictitious time step dt = 1.0
         self.solveP(1.0)
@@ -297,12 +518,8 @@ class Domain(object):
 
         self.time = time
 
-        for nodeList in self.nodes:
-            for node in nodeList:
-                node.setVelocity(zeros(2))
-        
-        for cell in self.cells:
-            cell.mapMassToNodes()
+        self.grid.setMass(self.grid.getLumpedMass())
+        self.grid.setVelocity(zeros(2))
 
         self.setNodalMotion(time)
 
@@ -336,6 +553,8 @@ class Domain(object):
                     self.writeData()
                     self.lastWrite = self.time
 
+        self.finishParticleUpdate()
+
     def runSingleStep(self, time=0.0, dt=1.0):
 
         t = process_time()
@@ -351,7 +570,15 @@ class Domain(object):
         if (self.analysisControl['solveVenhanced']):
             self.solveVenhanced(dt)
         if (self.analysisControl['updatePosition']):
-            self.updateParticleMotion(dt)
+            if (self.pipelined and self.batchedAdvection):
+                # snapshot the fields into the buffer not used by the update in progress
+                self.fieldBuffers.reverse()
+                fields = self.getAdvectionFields().copy(self.fieldBuffers[0])
+                self.finishParticleUpdate()
+                self.pendingParticleUpdate = self.pipeline.submit(self.advanceParticles, fields, time, dt)
+            else:
+                self.updateParticleMotion(dt)
+                self.updateTracers(time, dt)
         if (self.analysisControl['updateStress']):
             self.updateParticleStress()
             
@@ -360,9 +587,7 @@ class Domain(object):
 
     def initStep(self):
         # reset nodal mass, momentum, and force
-        for nodeList in self.nodes:
-            for node in nodeList:
-                node.wipe()
+        self.grid.wipe()
             
         # map mass and momentum to nodes
         for cell in self.cells:
@@ -370,117 +595,171 @@ class Domain(object):
             cell.mapMomentumToNodes()
 
     def solveVstar(self, dt, addTransient=False):
-        # compute nodal forces from shear
-        for i in range(self.nCellsX+1):
-            for j in range(self.nCellsY+1):
-                self.nodes[i][j].setForce(zeros(2))
-                
-        for cell in self.cells:
-            cell.computeForces(addTransient)
+        # compute nodal forces from shear (batched over all cells)
+        self.gatherCellVelocity()   # this initializes nodal velocities
+        cs = self.cellState
+        self.grid.setForce(
+            self.kernel.computeForces(cs.ux, cs.uy, cs.divVb, cs.divVc, self.mu, self.rho,
+                                      self.analysisControl['solveVenhanced'], addTransient) )
         
         # solve for nodal acceleration a*
         # and update nodal velocity to v*
-        for i in range(self.nCellsX+1):
-            for j in range(self.nCellsY+1):
-                self.nodes[i][j].updateVstar(dt)
+        self.grid.updateVstar(dt)
 
     def solveP(self, dt):
-        ndof = (self.nCellsX+1)*(self.nCellsY+1)
-        
-        # sparse outperformes dense very quickly for this problem.
-        # I lowered this number to 100 and might want to switch to sparse entirely.
-        if ndof <= 100:
-            useDense = True
-        else:
-            useDense = False
-        
-        # assemble matrix and force 
-        if (useDense):
-            # use dense matrix
-            self.FP = zeros(ndof)
-            self.KP = zeros((ndof,ndof))
-        else:
-            # use sparse matrix
-            self.FP = zeros(ndof)
-            KP = matrixDataType(ndof)
-        
-        for cell in self.cells:
-            ke = cell.GetStiffness()
-            fe = cell.GetPforce(dt)
-            nodeIndices = cell.getGridCoordinates()
-            dof = [ x[0] + x[1]*(self.nCellsX+1)   for x in nodeIndices ]
-            
-            if (useDense):
-                # use dense matrix
-                for i in range(4):
-                    self.FP[dof[i]] += fe[i]
-                    for j in range(4):
-                        self.KP[dof[i]][dof[j]] += ke[i][j]
-            else:
-                # use sparse matrix
-                for i in range(4):
-                    self.FP[dof[i]] += fe[i]
-                    for j in range(4):
-                        KP.add(ke[i][j],dof[i],dof[j]) 
+        # assemble force; the operator KP is cached by the pressure solver
+        self.gatherCellVelocity()
+        cs = self.cellState
+        fe = self.kernel.computePforce(cs.divVa, cs.divVb, cs.divVc, self.rho, dt)
+        self.FP = self.getAssembler().assembleVector(fe)
                         
         # apply boundary conditions
-        i = self.nCellsX // 2
-        dof = i + self.nCellsY*(self.nCellsX+1)
-        
-            
-        if (useDense):
-            # use dense matrix
-            self.KP[dof][dof] = 1.0e20
-            self.FP[dof] = 0.0
-        else:
-            # use sparse matrix
-            KP.add(1.0e20, dof, dof)
-            self.FP[dof] = 0.0
+        self.FP[self.getPressurePin()] = 0.0
             
         # solve for nodal p
-        if (useDense):
-            # use dense matrix
-            pressure = solve(self.KP, self.FP)
-        else:
-            # use sparse matrix
-            self.KP = KP.toCSCmatrix()
-            pressure = spsolve(self.KP, self.FP)
+        pressure = self.pressureSolver.solve(self, self.FP)
+        self.KP = self.pressureSolver.getOperator()
         
-        # assign pressure to nodes
-        for i in range(self.nCellsX+1):
-            for j in range(self.nCellsY+1):
-                dof = i + j*(self.nCellsX+1)
-                self.nodes[i][j].setPressure(pressure[dof])
+        # assign pressure to nodes (dof = i + j*(nCellsX+1) matches the [j,i] layout)
+        self.grid.setPressure(pressure.reshape(self.grid.shape()))
                 
         #print(pressure)
 
     def solveVtilde(self, dt):
-        for i in range(self.nCellsX+1):
-            for j in range(self.nCellsY+1):
-                # compute nodal pressure gradient
-                if ( i==0 or i==self.nCellsX ):
-                    dpx = 0.0
-                else:
-                    dpx = 0.5*(self.nodes[i+1][j].getPressure()-self.nodes[i-1][j].getPressure())/self.hx
-                
-                if ( j==0 or j==self.nCellsY ):
-                    dpy = 0.0
-                else:
-                    dpy = 0.5*(self.nodes[i][j+1].getPressure()-self.nodes[i][j-1].getPressure())/self.hy
+        # compute nodal pressure gradient
+        dp = self.grid.getPressureGradient(self.hx, self.hy)
         
-                # update nodal velocity
-                dv = -dt/self.rho * array([dpx,dpy])
-                self.nodes[i][j].addVelocity(dv)
+        # update nodal velocity
+        self.grid.addVelocity(-dt/self.rho * dp)
 
     def solveVenhanced(self, dt):
-        for cell in self.cells:
-            # initialize the divergence terms in the cell
-            cell.SetVelocity()
+        # initialize the divergence terms in all cells
+        self.gatherCellVelocity()
 
     def updateParticleStress(self):
-        pass
+        self.finishParticleUpdate()
+
+    def getAdvectionFields(self):
+        # cell fields as seen by Cell.GetVelocity and Cell.GetApparentAccel
+        self.gatherCellAcceleration()
+        cs = self.cellState
+        self.fields.setVelocity(cs.ux, cs.uy, cs.divVb, cs.divVc)
+        self.fields.setAcceleration(cs.ax, cs.ay)
+        self.fields.setEnhanced(self.analysisControl['solveVenhanced'])
+        self.fields.setTime(self.time)
+        return self.fields
+
+    def getCellPressure(self):
+        return self.kernel.gather(self.grid.pressure)
+
+    def getInterpolator(self, nThreads=4, blockSize=16384):
+        return FieldInterpolator(self.getAdvectionFields(), nThreads, blockSize)
 
     def updateParticleMotion(self, dt):
+        self.finishParticleUpdate()
+        if (self.batchedAdvection):
+            self.advector.advance(self.particles, self.getAdvectionFields(), dt)
+        else:
+            self.updateParticleMotionSerial(dt)
+
+        self.finishParticleMotion(self.time, dt)
+
+    def finishParticleMotion(self, time, dt):
+        self.finishParticleUpdate()
+        self.particles.recordTraces(time + dt)
+        self.relocateParticles()
+
+        if self.ordering.isDue():
+            self.reorderParticles()
+
+    def advanceParticles(self, fields, time, dt):
+        # runs on the pipeline thread; reads nothing but fields from the grid
+        self.pipelineThread = threading.current_thread()
+        self.advector.advance(self.particles, fields, dt)
+        self.finishParticleMotion(time, dt)
+        self.updateTracers(time, dt, fields)
+
+    def setPipelinedExecution(self, OnOff=True):
+        self.finishParticleUpdate()
+        if (OnOff and self.pipeline is None):
+            self.pipeline = ThreadPoolExecutor(1)
+            fields = self.getAdvectionFields()
+            self.fieldBuffers = [fields.copy(), fields.copy()]
+        elif (not OnOff and self.pipeline is not None):
+            self.pipeline.shutdown()
+            self.pipeline = None
+            self.fieldBuffers = []
+        self.pipelined = OnOff
+
+    def finishParticleUpdate(self):
+        # every public method touching the particles calls this; on the pipeline thread it does nothing
+        if (self.pendingParticleUpdate is not None and threading.current_thread() is not self.pipelineThread):
+            future = self.pendingParticleUpdate
+            self.pendingParticleUpdate = None
+            future.result()   # re-raises errors of the particle update
+
+    def setParticleReordering(self, interval, curve='morton'):
+        self.finishParticleUpdate()
+        self.ordering.setCurve(curve)
+        self.ordering.setInterval(interval)
+
+    def reorderParticles(self, curve=None):
+        self.finishParticleUpdate()
+        if (curve != None and curve != self.ordering.curve):
+            self.ordering.setCurve(curve)
+        self.ordering.reorder(self.particles)
+
+        # slots have moved
+        self.cellIndex.invalidate()
+
+    def relocateParticles(self):
+        self.finishParticleUpdate()
+        pset  = self.particles
+        n     = len(pset)
+        chunk = self.advector.chunkSize if self.advector.chunkSize else max(n, 1)
+
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+            pset.hostCell[start:stop] = self.locator.relocate(pset.position[start:stop], pset.hostCell[start:stop])
+
+        # Cell.myParticles follow the host cells through the index
+        self.cellIndex.invalidate()
+
+    def setParticleSet(self, pset):
+        self.finishParticleUpdate()
+        # pset replaces the particles of the domain and is assigned to the cells
+        self.particles = pset
+        self.cellIndex.setParticleSet(pset)
+        pset.hostCell[:len(pset)] = -1
+        self.relocateParticles()
+
+    def setParticleChunkSize(self, chunkSize):
+        self.finishParticleUpdate()
+        self.advector.setChunkSize(chunkSize)
+
+    def getAdvectionStatistics(self):
+        self.finishParticleUpdate()
+        return self.advector.getStatistics()
+
+    def getCellIndex(self):
+        self.finishParticleUpdate()
+        # rebuilt only if particles were added or moved since the last query
+        return self.cellIndex.update()
+
+    def getParticlesInCell(self, k):
+        self.finishParticleUpdate()
+        return self.getCellIndex().getParticles(k)
+
+    def getCellOccupancy(self):
+        self.finishParticleUpdate()
+        return self.getCellIndex().getCounts()
+
+    def getLocatorStatistics(self):
+        self.finishParticleUpdate()
+        return self.locator.getStatistics()
+
+    def updateParticleMotionSerial(self, dt):
+        self.finishParticleUpdate()
         # this is the Butcher tableau
         a = dt*self.particleUpdateScheme.get_a()  # time factors
         b = dt*self.particleUpdateScheme.get_b()  # position factors
@@ -526,7 +805,7 @@ class Domain(object):
                     
 
                 # update particle position ...
-                p.addToPosition(xn1 - p.position())
+                p.pos += xn1 - p.position()
                 
                 # update particle velocity ...
                 cell = self.findCell(xn1)
@@ -545,7 +824,7 @@ class Domain(object):
         if (testCell != None  and  testCell.contains(x)):
             return testCell
         
-        # find a cell that contains x
+        # find a cell that contains x (cell ids are k = nCellsY*i + j)
         i = np.int_((x[0] - 0.0) / self.hx)
         j = np.int_((x[1] - 0.0) / self.hy)
 
@@ -558,7 +837,7 @@ class Domain(object):
         if (j>self.nCellsY-1):
             j = self.nCellsY -1
             
-        k = self.nCellsX * i + j
+        k = self.nCellsY * i + j
         
         try:
             cell = self.cells[k]
@@ -571,98 +850,233 @@ class Domain(object):
         
         return cell
     
+    def findCells(self, X, strict=False):
+        '''
+        locate all points X (N,2) at once.
+
+        returns the cell ids k (N,) and the local coordinates (s,t) (N,2),
+        clamped to the cell like Cell.setShape does.  Points outside the
+        grid are assigned to the nearest boundary cell; their number is
+        kept in self.outsideCount.  With strict=True a CellIndexError
+        listing all such points (and their indices in X) is raised instead.
+        '''
+        X = asarray(X, dtype=float).reshape((-1,2))
+        k, xl, outside = self.fields.locate(X)
+
+        self.outsideCount = outside.sum()
+        if (strict and self.outsideCount > 0):
+            kOut = k[outside]
+            raise CellIndexError((kOut // self.nCellsY, kOut % self.nCellsY, kOut, X[outside]), outside.nonzero()[0])
+
+        return k, xl
+
+    def seedParticles(self, n, m, cells=None, pattern='regular', region=None, seed=None):
+        '''
+        create n x m particles per cell in one array operation.
+
+        cells   ... ids of the cells to seed (default: all cells)
+        pattern ... 'regular': centers of the n x m sub-cells (as createParticles)
+                    'jitter':  a random point in each of the n x m sub-cells
+        region  ... keep only particles inside region, given as a box
+                    (xmin, ymin, xmax, ymax) or a function X -> bool mask
+        seed    ... seed for the random number generator used by 'jitter'
+
+        Every particle carries the mass of its sub-cell, rho*hx*hy/n/m.
+        returns the storage slots of the new particles
+        '''
+        self.finishParticleUpdate()
+        if (cells is None):
+            cells = np.arange(len(self.cells))
+        cells = asarray(cells, dtype=int)
+
+        # local coordinates of the pattern: i outer, j inner
+        s, t = np.meshgrid(-1. + (2*np.arange(n)+1)/n, -1. + (2*np.arange(m)+1)/m, indexing='ij')
+        xl = np.stack((s.ravel(), t.ravel()), -1)
+        
+        k  = np.repeat(cells, n*m)
+        xl = np.tile(xl, (len(cells),1))
+
+        if (pattern == 'jitter'):
+            rng = np.random.default_rng(seed)
+            xl += rng.uniform(-1., 1., xl.shape) / array([n, m])
+        elif (pattern != 'regular'):
+            raise ValueError("unknown seeding pattern '{}'".format(pattern))
+
+        # Cell.getGlobal for all points
+        size = array([self.hx, self.hy])
+        X = 0.5*xl*size + self.fields.centers[k]
+
+        if (region is not None):
+            if callable(region):
+                keep = region(X)
+            else:
+                xmin, ymin, xmax, ymax = region
+                keep = (X[:,0] >= xmin) & (X[:,0] <= xmax) & (X[:,1] >= ymin) & (X[:,1] <= ymax)
+            X = X[keep]
+            k = k[keep]
+
+        mp = self.rho*self.hx*self.hy/n/m
+        slots = self.particles.addParticles(mp, X)
+        self.particles.hostCell[slots] = k
+        self.registerParticles(slots)
+        
+        return slots
+
+    def registerParticles(self, slots):
+        self.finishParticleUpdate()
+        # the host cells of slots are set; the cells see them through the index
+        self.cellIndex.invalidate()
+
     def createParticles(self, n, m):
-        for cell in self.cells:
-            h = cell.getSize()
-            mp = self.rho,h[0]*h[1]/n/m
-            
-            for i in range(n):
-                s = -1. + (2*i+1)/n
-                for j in range(m):
-                    t = -1. + (2*j+1)/m
-                    xl = array([s,t])
-                    xp = cell.getGlobal(xl)
-                    newParticle = Particle(mp,xp)
-                    self.particles.append(newParticle)
-                    cell.addParticle(newParticle)
+        self.seedParticles(n, m)
 
     def createParticlesMID(self, n, m):
-        for cell in self.cells:
-            if ( cell.getID() != int( (self.nCellsX) * (self.nCellsY) / 2) - int(self.nCellsY/2.0) ):
-                continue
-            # print(cell.getID())
-            h = cell.getSize()
-            mp = self.rho,h[0]*h[1]/n/m
-            
-            for i in range(n):
-                s = -1. + (2*i+1)/n
-                # s = 0.5
-                for j in range(m):
-                    t = -1. + (2*j+1)/m
-                    # t = 0.5
-                    xl = array([s,t])
-                    xp = cell.getGlobal(xl)
-                    # print(xp)
-                    newParticle = Particle(mp,xp)
-                    self.particles.append(newParticle)
-                    cell.addParticle(newParticle)        
-                    
+        middle = int( (self.nCellsX) * (self.nCellsY) / 2) - int(self.nCellsY/2.0)
+        self.seedParticles(n, m, cells=[middle])
     
     def createParticleAtX(self, mp, xp):     # Particle creator that generates a single particle at position X
-        newParticle = Particle(mp,xp)
-        self.particles.append(newParticle)
+        self.finishParticleUpdate()
+        newParticle = self.particles.addParticle(mp,xp)
         cell = self.findCell(xp)
         if (cell):
             cell.addParticle(newParticle)
     
+    def createParticlesAtX(self, mp, X):
+        self.finishParticleUpdate()
+        pset  = self.particles
+        slots = pset.addParticles(mp, X)
+        k, xl = self.findCells(pset.position[slots])
+        pset.hostCell[slots] = k
+        self.registerParticles(slots)
+
+        return slots
+
+    def removeParticles(self, slots):
+        self.finishParticleUpdate()
+        # the pool fills the freed slots; the cells see the change through the index
+        self.particles.remove(slots)
+        self.cellIndex.invalidate()
+
+    def addInjector(self, injector):
+        self.finishParticleUpdate()
+        self.injectors.append(injector)
+
+    def setWallRetirement(self, OnOff=True, tolerance=0.0):
+        self.finishParticleUpdate()
+        # retire particles closer than tolerance to a wall
+        self.retireAtWalls = OnOff
+        self.wallTolerance = tolerance
+
+    def retireParticles(self, time):
+        self.finishParticleUpdate()
+        # lifetimes are set by the injectors; without finite ones only the walls retire particles
+        finite = any(injector.lifetime < inf for injector in self.injectors)
+        if not (finite or self.retireAtWalls):
+            return
+
+        pset  = self.particles
+        n     = len(pset)
+        chunk = self.advector.chunkSize if self.advector.chunkSize else max(n, 1)
+        tol   = self.wallTolerance
+
+        # test chunk by chunk, so the temporaries do not grow with the set
+        retired = []
+        for start in range(0, n, chunk):
+            stop = min(start + chunk, n)
+
+            if finite:
+                retire = (time - pset.birth[start:stop]) >= pset.lifetime[start:stop]
+            else:
+                retire = np.zeros(stop - start, dtype=bool)
+
+            if (self.retireAtWalls):
+                X = pset.position[start:stop]
+                retire |= (X[:,0] <= tol) | (X[:,0] >= self.width  - tol)
+                retire |= (X[:,1] <= tol) | (X[:,1] >= self.height - tol)
+
+            retired.append(start + retire.nonzero()[0])
+
+        slots = np.concatenate(retired) if retired else []
+        if (len(slots) > 0):
+            self.removeParticles(slots)
+
+    def injectParticles(self, time, dt, fields=None):
+        self.finishParticleUpdate()
+        pset = self.particles
+        for injector in self.injectors:
+            X, T = injector.getReleases(time, dt)
+            if (len(X) == 0):
+                continue
+
+            slots = self.createParticlesAtX(injector.mass, X)
+            pset.birth[slots]       = T
+            pset.lifetime[slots]    = injector.lifetime
+            pset.recordTrace[slots] = self.recordParticleTrace
+
+            # advance every particle from its release to the end of the step (slots are contiguous)
+            if fields is None:
+                fields = self.getAdvectionFields()
+            start, stop = slots[0], slots[-1] + 1
+            self.advector.advance(pset, fields, time + dt - T, start, stop, T - time)
+            pset.hostCell[start:stop] = self.locator.relocate(pset.position[start:stop], pset.hostCell[start:stop])
+
+    def updateTracers(self, time, dt, fields=None):
+        self.finishParticleUpdate()
+        self.retireParticles(time + dt)
+        self.injectParticles(time, dt, fields)
+
     def getTimeStep(self, CFL):
         dt = 1.0e10
         
-        for nodeList in self.nodes:
-            for node in nodeList:
-                vel = node.getVelocity()
-                if (abs(vel[0]) > 1.0e-5):
-                    dtx = self.hx / abs(vel[0])
-                    if (dtx<dt):
-                        dt = dtx
-                if (abs(vel[1]) > 1.0e-5):
-                    dty = self.hy / abs(vel[1])
-                    if (dty<dt):
-                        dt = dty
+        speed = abs(self.grid.getVelocity())
+        
+        vx = speed[:,:,0][speed[:,:,0] > 1.0e-5]
+        if (vx.size > 0):
+            dt = min(dt, self.hx / vx.max())
+        vy = speed[:,:,1][speed[:,:,1] > 1.0e-5]
+        if (vy.size > 0):
+            dt = min(dt, self.hy / vy.max())
 
         return dt*CFL
 
     def plotData(self):
+        self.finishParticleUpdate()
         self.computeCellFlux()
         self.plot.setCellFluxData(self.cells)
-        self.plot.setData(self.nodes)
+        self.plot.setGridData(self.grid)
         self.plot.setParticleData(self.particles)
         self.plot.refresh(self.time)
 
     def writeData(self):
-        self.writer.setData(self.nodes)
+        self.finishParticleUpdate()
+        self.writer.setGridData(self.grid)
         self.writer.setParticleData(self.particles)
         self.writer.writeData(self.time)
 
     def setNodalMotion(self, time=0.0):
 
         # set nodal velocity field
-        for rowOfNodes in self.nodes:
-            for node in rowOfNodes:
-                x = node.getPosition()  # x is Eulerial nodal position
-                node.setVelocity( self.motion.getVel(x, time) )
-                node.setApparentAccel( self.motion.getDvDt(x, time) )
-
-        for cell in self.cells:
-            cell.SetVelocity()
+        vel   = zeros((self.nCellsY+1, self.nCellsX+1, 2))
+        accel = zeros((self.nCellsY+1, self.nCellsX+1, 2))
+        for j in range(self.nCellsY+1):
+            for i in range(self.nCellsX+1):
+                x = self.grid.position[j,i].copy()  # x is Eulerial nodal position
+                vel[j,i]   = self.motion.getVel(x, time)
+                accel[j,i] = self.motion.getDvDt(x, time)
+        self.grid.setVelocity(vel)
+        self.grid.setApparentAccel(accel)
+
+        self.gatherCellVelocity()
 
     def getParticles(self):
+        self.finishParticleUpdate()
         return self.particles
 
     def setTime(self, time):
         self.time = time
 
     def plotParticleTrace(self, filename):
+        self.finishParticleUpdate()
         plotter = ParticleTracePlot()
         plotter.setDomain(0.0, 0.0, self.width, self.height)
 
@@ -671,7 +1085,7 @@ class Domain(object):
             for particle in self.particles:
                 pDict = {}
                 pDict['node'] = particle.id
-                pDict['path'] = array(particle.getTrace())
+                pDict['path'] = particle.getTrace()
                 particleTraceList.append(pDict)
 
         plotter.addTraces(particleTraceList)
@@ -0,0 +1,167 @@
+from numpy import array, zeros, sqrt, arange, stack, einsum, bincount, meshgrid, tile
+
+from ShapeFunctions import *
+
+
+class ElementKernel(object):
+    '''
+    Batched element operations for all cells of a uniform structured grid.
+
+    Cell-wise arrays are ordered by cell id (k = nCellsY*i + j), which is
+    the order of Domain.cells.  Local node numbering follows Cell.SetNodes:
+    (i,j), (i+1,j), (i+1,j+1), (i,j+1).
+
+    variables:
+        self.nCellsX
+        self.nCellsY
+        self.size      = array([hx,hy])
+        self.cellNodes = (nCells, 4)   # flat node index j*(nCellsX+1)+i per cell corner
+        self.gpts      = (4, 2)        # 2x2 Gauss points, s outer and t inner
+        self.N         = (4, 4)        # shape functions at Gauss points
+        self.DNx       = (4, 4)        # x-derivatives at Gauss points
+        self.DNy       = (4, 4)        # y-derivatives at Gauss points
+        self.w         = hx*hy/4       # Gauss weight
+
+    methods:
+        def __init__(self, hx, hy, nCellsX, nCellsY)
+        def shapeFunctions(self, s, t)
+        def gather(self, field)
+        def scatter(self, cellValues)
+        def cellDivergence(self, ux, uy)
+        def computeForces(self, ux, uy, divVb, divVc, mu, rho, useEnhanced=False, addTransient=False)
+        def computeStiffness(self)
+        def computePforce(self, divVa, divVb, divVc, rho, dt)
+        def computeLumpedMass(self, rho)
+    '''
+
+    def __init__(self, hx, hy, nCellsX, nCellsY):
+        '''
+        Constructor
+        '''
+        self.nCellsX = nCellsX
+        self.nCellsY = nCellsY
+        self.nNodesX = nCellsX + 1
+        self.nNodesY = nCellsY + 1
+        self.size    = array([hx, hy])
+
+        # element-to-node map in cell id order
+        i, j = meshgrid(arange(nCellsX), arange(nCellsY), indexing='ij')
+        n00  = (j*self.nNodesX + i).ravel()
+        self.cellNodes = stack((n00, n00 + 1, n00 + 1 + self.nNodesX, n00 + self.nNodesX), -1)
+
+        # Gauss point tables
+        g = 1./sqrt(3.)
+        self.gpts = array([[-g, -g], [-g, g], [g, -g], [g, g]])
+        self.N, self.DNx, self.DNy = self.shapeFunctions(self.gpts[:,0], self.gpts[:,1])
+        self.w = hx*hy/4.
+
+    def shapeFunctions(self, s, t):
+        return shapeFunctions(s, t, self.size)
+
+    def gather(self, field):
+        # field is a nodal array (nNodesY, nNodesX[, ...]); returns (nCells, 4[, ...])
+        flat = field.reshape((self.nNodesY*self.nNodesX,) + field.shape[2:])
+        return flat[self.cellNodes]
+
+    def scatter(self, cellValues):
+        # sum (nCells, 4[, ncomp]) contributions into a nodal array (nNodesY, nNodesX[, ncomp])
+        nNodes = self.nNodesY*self.nNodesX
+        if cellValues.ndim == 2:
+            result = bincount(self.cellNodes.ravel(), weights=cellValues.ravel(), minlength=nNodes)
+            return result.reshape((self.nNodesY, self.nNodesX))
+
+        ncomp = cellValues.shape[-1]
+        idx = (ncomp*self.cellNodes[:,:,None] + arange(ncomp)[None,None,:]).ravel()
+        result = bincount(idx, weights=cellValues.ravel(), minlength=ncomp*nNodes)
+        return result.reshape((self.nNodesY, self.nNodesX, ncomp))
+
+    def cellDivergence(self, ux, uy):
+        # same expressions as Cell.SetVelocity, for all cells at once
+        hx, hy = self.size
+        divVa  = 0.5*(-ux[:,0] + ux[:,1] + ux[:,2] - ux[:,3]) / hx
+        divVa += 0.5*(-uy[:,0] - uy[:,1] + uy[:,2] + uy[:,3]) / hy
+        divVb  = 0.5*(uy[:,0] - uy[:,1] + uy[:,2] - uy[:,3]) / hy
+        divVc  = 0.5*(ux[:,0] - ux[:,1] + ux[:,2] - ux[:,3]) / hx
+        return divVa, divVb, divVc
+
+    def computeForces(self, ux, uy, divVb, divVc, mu, rho, useEnhanced=False, addTransient=False):
+        '''
+        batched version of Cell.computeForces for all cells.
+
+        ux, uy       ... gathered cell velocities (nCells, 4)
+        divVb, divVc ... enhanced field parameters (nCells,)
+        returns nodal forces (nNodesY, nNodesX, 2)
+        '''
+        hx, hy = self.size
+        w = self.w
+
+        forces = zeros(ux.shape + (2,))
+
+        for g in range(4):
+            s, t = self.gpts[g]
+            N   = self.N[g]
+            DNx = self.DNx[g]
+            DNy = self.DNy[g]
+
+            dxu = einsum('k,ck->c', DNx, ux)
+            dyu = einsum('k,ck->c', DNy, ux)
+            dxv = einsum('k,ck->c', DNx, uy)
+            dyv = einsum('k,ck->c', DNy, uy)
+
+            # deviatoric strain rate (Cell.GetStrainRate)
+            dd = (dxu + dyv) / 3.
+            d0 = dxu - dd
+            d1 = dyv - dd
+            d2 = dyu + dxv
+
+            if useEnhanced:
+                # Cell.GetEnhancedStrainRate
+                d0 = d0 + -2.*divVb*s/hx
+                d1 = d1 + -2.*divVc*t/hy
+
+            d11 = w* 2.0*mu * d0
+            d22 = w* 2.0*mu * d1
+            d12 = w*     mu * d2
+
+            forces[:,:,0] -= d11[:,None]*DNx + d12[:,None]*DNy
+            forces[:,:,1] -= d12[:,None]*DNx + d22[:,None]*DNy
+
+            if addTransient:
+                # add  w . (grad v) . v
+                vx = einsum('k,ck->c', N, ux)
+                vy = einsum('k,ck->c', N, uy)
+                aTransient = stack((dxu*vx + dyu*vy, dxv*vx + dyv*vy), -1)
+
+                forces -= w * rho * (N[None,:,None] * aTransient[:,None,:])
+
+        return self.scatter(forces)
+
+    def computeStiffness(self):
+        # element "stiffness matrix" for pressure calculation (Cell.GetStiffness);
+        # identical for all cells of a uniform grid
+        Ke = zeros((4,4))
+        for g in range(4):
+            B = stack((self.DNx[g], self.DNy[g]))
+            Ke += self.w*(B.T @ B)
+        return Ke
+
+    def computePforce(self, divVa, divVb, divVc, rho, dt):
+        # driving force for pressure (Cell.GetPforce) as (nCells, 4)
+        w = rho*self.size[0]*self.size[1]/4./dt
+
+        Fe = zeros((len(divVa), 4))
+        for g in range(4):
+            s, t = self.gpts[g]
+            divV = divVa + divVb*s + divVc*t
+            Fe += (-w*self.N[g])[None,:] * divV[:,None]
+        return Fe
+
+    def computeLumpedMass(self, rho):
+        # nodal mass from all cells (Cell.mapMassToNodes) as (nNodesY, nNodesX)
+        w = rho * self.size[0]*self.size[1]/4.
+
+        mass = zeros(4)
+        for g in range(4):
+            mass += w*self.N[g]
+
+        return self.scatter(tile(mass, (len(self.cellNodes),1)))
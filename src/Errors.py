@@ -4,12 +4,24 @@ Created on Jun 26, 2018
 @author: pmackenz
 '''
 
+from numpy import asarray
+
+
 class CellIndexError(Exception):
     '''
-    classdocs
+    raised for positions that cannot be assigned to a cell.
+
+    e = (i, j, k, pos) for a single position pos = [x,y], or
+    e = (i, j, k, pos) with arrays i, j, k of shape (N,) and pos of shape (N,2)
+    for all offending points of a batch.
+
+    variables:
+        self.i, self.j, self.k
+        self.pos
+        self.indices    # positions of the offending points within the batch, or None
     '''
 
-    def __init__(self, e):
+    def __init__(self, e, indices=None):
         '''
         Constructor
         '''
@@ -18,7 +30,17 @@ class CellIndexError(Exception):
         self.j = e[1]
         self.k = e[2]
         self.pos = e[3]
-        
+        self.indices = indices
+
     def __str__(self):
-        return "position {}/{} resulted in i={}, j={} and k={}".format(*self.pos, self.i, self.j, self.k)
+        pos = asarray(self.pos)
+        if (pos.ndim == 1):
+            return "position {}/{} resulted in i={}, j={} and k={}".format(*self.pos, self.i, self.j, self.k)
+
+        s = "{} positions outside their cells:".format(len(pos))
+        for n in range(min(len(pos), 10)):
+            s += "\n  position {}/{} resulted in i={}, j={} and k={}".format(*pos[n], self.i[n], self.j[n], self.k[n])
+        if (len(pos) > 10):
+            s += "\n  ..."
+        return s
     
\ No newline at end of file
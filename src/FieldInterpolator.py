@@ -0,0 +1,85 @@
+from numpy import empty
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FieldInterpolator(object):
+    '''
+    Thread-parallel interpolation of AdvectionFields at many points, e.g.
+    particle positions or probe locations.
+
+    The points are split into blocks of blockSize points which are
+    evaluated by a ThreadPoolExecutor.  The work of a block is done in
+    NumPy operations on whole arrays, which release the GIL, so blocks run
+    concurrently.  Every block writes its own slice of the results; the
+    fields are only read (AdvectionFields keeps no evaluation state).
+
+    variables:
+        self.fields    = AdvectionFields
+        self.nThreads
+        self.blockSize
+        self.executor  = ThreadPoolExecutor   # created on first use
+
+    methods:
+        def __init__(self, fields, nThreads=4, blockSize=16384)
+        def setFields(self, fields)
+        def run(self, function, n)                       # function(start, stop) for all blocks; returns their results
+        def evaluate(self, X, a=0.0, gradients=True)     # AdvectionFields.evaluate
+        def interpolate(self, X, values, gradients=True) # AdvectionFields.interpolate
+        def close(self)
+    '''
+
+    def __init__(self, fields, nThreads=4, blockSize=16384):
+        '''
+        Constructor
+        '''
+        self.fields    = fields
+        self.nThreads  = nThreads
+        self.blockSize = blockSize
+        self.executor  = None
+
+    def __str__(self):
+        return "FieldInterpolator({} threads, blocks of {})".format(self.nThreads, self.blockSize)
+
+    def setFields(self, fields):
+        self.fields = fields
+
+    def run(self, function, n):
+        if (self.executor is None):
+            self.executor = ThreadPoolExecutor(self.nThreads)
+
+        futures = [self.executor.submit(function, start, min(start + self.blockSize, n))
+                   for start in range(0, n, self.blockSize)]
+        return [future.result() for future in futures]
+
+    def evaluate(self, X, a=0.0, gradients=True):
+        n    = len(X)
+        vel  = empty((n,2))
+        grad = empty((n,2,2)) if gradients else None
+
+        def block(start, stop):
+            v, g, outside = self.fields.evaluate(X[start:stop], a, gradients)
+            vel[start:stop] = v
+            if gradients:
+                grad[start:stop] = g
+            return outside
+
+        return vel, grad, sum(self.run(block, n))
+
+    def interpolate(self, X, values, gradients=True):
+        n     = len(X)
+        value = empty(n)
+        grad  = empty((n,2)) if gradients else None
+
+        def block(start, stop):
+            v, g, outside = self.fields.interpolate(X[start:stop], values, gradients)
+            value[start:stop] = v
+            if gradients:
+                grad[start:stop] = g
+            return outside
+
+        return value, grad, sum(self.run(block, n))
+
+    def close(self):
+        if (self.executor is not None):
+            self.executor.shutdown()
+            self.executor = None
@@ -0,0 +1,179 @@
+from numpy import zeros, full, stack, meshgrid, sqrt
+
+
+class GridState(object):
+    '''
+    Contiguous storage of all nodal fields of a structured grid.
+
+    All arrays are indexed as [j,i] (row = y-direction, column = x-direction),
+    which is the layout used by meshgrid(x, y) and by the Writer and Plotter.
+
+    The velocity (mass, momentum) and the apparent acceleration carry a
+    modification epoch.  All methods of GridState and Node that change them
+    advance the epoch; code writing to the arrays directly has to call
+    touchVelocity() / touchAccel().  Cells use the epochs to skip gathers of
+    unchanged nodal fields.
+
+    variables:
+        self.nNodesX
+        self.nNodesY
+        self.position   = zeros((nNodesY, nNodesX, 2))   # nodal coordinates
+        self.mass       = zeros((nNodesY, nNodesX))
+        self.momentum   = zeros((nNodesY, nNodesX, 2))
+        self.force      = zeros((nNodesY, nNodesX, 2))
+        self.pressure   = zeros((nNodesY, nNodesX))
+        self.appAccel   = zeros((nNodesY, nNodesX, 2))   # apparent acceleration
+        self.aStar      = zeros((nNodesY, nNodesX, 2))
+        self.fixed      = zeros((nNodesY, nNodesX, 2), dtype=bool)   # fixity mask
+        self.fixedValue = zeros((nNodesY, nNodesX, 2))   # prescribed velocity
+        self.lumpedMass = None                            # cached nodal mass (or None)
+        self.velocityEpoch = 0    # advanced whenever mass or momentum change
+        self.accelEpoch    = 0    # advanced whenever the apparent acceleration changes
+
+    methods:
+        def __init__(self, nNodesX=1, nNodesY=1)
+        def setCoordinates(self, x, y)
+        def shape(self)
+        def touchVelocity(self)
+        def touchAccel(self)
+        def setLumpedMass(self, m)
+        def getLumpedMass(self)
+        def wipe(self)
+        def setMass(self, m)
+        def getVelocity(self)
+        def getNodalFields(self)    # P, Vx, Vy, Fx, Fy, Ax, Ay, speed for plotting and output
+        def setVelocity(self, v)
+        def addVelocity(self, dv)
+        def setPressure(self, p)
+        def setApparentAccel(self, a)
+        def setForce(self, F)
+        def fixDOF(self, i, j, dof, val=0.0)
+        def releaseDOFs(self)
+        def updateVstar(self, dt)
+        def getPressureGradient(self, hx, hy)
+    '''
+
+    def __init__(self, nNodesX=1, nNodesY=1):
+        '''
+        Constructor
+        '''
+        self.nNodesX = nNodesX
+        self.nNodesY = nNodesY
+
+        self.position = zeros((nNodesY, nNodesX, 2))
+
+        self.mass     = full((nNodesY, nNodesX), 1.e-16)
+        self.momentum = zeros((nNodesY, nNodesX, 2))
+        self.force    = zeros((nNodesY, nNodesX, 2))
+        self.pressure = zeros((nNodesY, nNodesX))
+        self.appAccel = zeros((nNodesY, nNodesX, 2))
+        self.aStar    = zeros((nNodesY, nNodesX, 2))
+
+        self.fixed      = zeros((nNodesY, nNodesX, 2), dtype=bool)
+        self.fixedValue = zeros((nNodesY, nNodesX, 2))
+
+        self.lumpedMass = None
+
+        self.velocityEpoch = 0
+        self.accelEpoch    = 0
+
+    def __str__(self):
+        return "GridState({}x{} nodes)".format(self.nNodesX, self.nNodesY)
+
+    def setCoordinates(self, x, y):
+        X, Y = meshgrid(x, y, indexing='xy')
+        self.position = stack((X, Y), -1)
+
+    def shape(self):
+        return (self.nNodesY, self.nNodesX)
+
+    def touchVelocity(self):
+        self.velocityEpoch += 1
+
+    def touchAccel(self):
+        self.accelEpoch += 1
+
+    def setLumpedMass(self, m):
+        # nodal mass only depends on density and geometry
+        self.lumpedMass = m
+        if m is not None:
+            self.mass[:] = m
+            self.touchVelocity()
+
+    def getLumpedMass(self):
+        return self.lumpedMass
+
+    def wipe(self):
+        # reset nodal momentum and force; mass is reset to the lumped mass if known
+        if self.lumpedMass is None:
+            self.mass[:] = 0.0
+        else:
+            self.mass[:] = self.lumpedMass
+        self.momentum[:] = 0.0
+        self.force[:]    = 0.0
+        self.touchVelocity()
+
+    def setMass(self, m):
+        self.mass[:] = m
+        self.touchVelocity()
+
+    def getVelocity(self):
+        if (self.mass <= 0.0).any():
+            print("NO mass at node")
+            raise ZeroDivisionError("nodal mass must be positive")
+        return self.momentum / self.mass[:,:,None]
+
+    def getNodalFields(self):
+        # copies of the nodal fields, each (nNodesY, nNodesX)
+        vel = self.getVelocity()
+        Vx  = vel[:,:,0]
+        Vy  = vel[:,:,1]
+        return (self.pressure.copy(), Vx, Vy,
+                self.force[:,:,0].copy(), self.force[:,:,1].copy(),
+                self.appAccel[:,:,0].copy(), self.appAccel[:,:,1].copy(),
+                sqrt(Vx*Vx + Vy*Vy))
+
+    def setVelocity(self, v):
+        self.momentum[:] = self.mass[:,:,None] * v
+        self.touchVelocity()
+
+    def addVelocity(self, dv):
+        # boundary conditions: fixed DOFs are not updated
+        free = ~self.fixed
+        self.momentum[free] += (self.mass[:,:,None] * dv)[free]
+        self.touchVelocity()
+
+    def setPressure(self, p):
+        self.pressure[:] = p
+
+    def setApparentAccel(self, a):
+        self.appAccel[:] = a
+        self.touchAccel()
+
+    def setForce(self, F):
+        self.force[:] = F
+
+    def fixDOF(self, i, j, dof, val=0.0):
+        self.fixed[j,i,dof]      = True
+        self.fixedValue[j,i,dof] = val
+
+    def releaseDOFs(self):
+        self.fixed[:]      = False
+        self.fixedValue[:] = 0.0
+
+    def updateVstar(self, dt):
+        # apply boundary condition
+        fixed = self.fixed
+        self.force[fixed] = ((self.mass[:,:,None]*self.fixedValue - self.momentum) / dt)[fixed]
+
+        # update velocity
+        self.aStar = self.force / self.mass[:,:,None]
+        self.addVelocity(self.aStar * dt)
+
+    def getPressureGradient(self, hx, hy):
+        # central differences in the interior, zero normal gradient on the boundary
+        P  = self.pressure
+        dp = zeros(self.momentum.shape)
+        dp[:,1:-1,0] = 0.5*(P[:,2:] - P[:,:-2])/hx
+        dp[1:-1,:,1] = 0.5*(P[2:,:] - P[:-2,:])/hy
+        return dp
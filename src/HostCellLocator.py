@@ -0,0 +1,80 @@
+from numpy import abs, minimum, maximum
+
+
+class HostCellLocator(object):
+    '''
+    Cell search starting from a remembered host cell.
+
+    A point is first tested against its cached host cell, then against the
+    neighbor in the direction it left that cell, and only the remaining
+    points are located from scratch (AdvectionFields.locate).  Points
+    without a cached host use host = -1.
+
+    variables:
+        self.fields       = AdvectionFields   # grid geometry and global search
+        self.hits         # points found in their cached cell
+        self.neighborHits # points found in a neighbor of their cached cell
+        self.misses       # points located by the global search
+
+    methods:
+        def __init__(self, fields)
+        def relocate(self, X, host)   # returns new host cell ids
+        def getStatistics(self)
+        def resetStatistics(self)
+    '''
+
+    def __init__(self, fields):
+        '''
+        Constructor
+        '''
+        self.fields = fields
+        self.resetStatistics()
+
+    def __str__(self):
+        return "HostCellLocator(hits={}, neighbors={}, misses={})".format(self.hits, self.neighborHits, self.misses)
+
+    def relocate(self, X, host):
+        kernel  = self.fields.kernel
+        centers = self.fields.centers
+        nCellsX = kernel.nCellsX
+        nCellsY = kernel.nCellsY
+
+        k = host.copy()
+
+        # test the cached cell
+        known = (host >= 0).nonzero()[0]
+        xl = 2*(X[known] - centers[host[known]]) / kernel.size
+        inside = (abs(xl) <= 1.0).all(axis=1)
+        self.hits += inside.sum()
+
+        # walk to the neighbor in the direction the point left its cell
+        walk = known[~inside]
+        xl   = xl[~inside]
+        i = host[walk] // nCellsY + (xl[:,0] > 1.0) - (xl[:,0] < -1.0)
+        j = host[walk] %  nCellsY + (xl[:,1] > 1.0) - (xl[:,1] < -1.0)
+        i = minimum(maximum(i, 0), nCellsX - 1)
+        j = minimum(maximum(j, 0), nCellsY - 1)
+        kn = nCellsY*i + j
+
+        xl = 2*(X[walk] - centers[kn]) / kernel.size
+        found = (abs(xl) <= 1.0).all(axis=1)
+        k[walk[found]] = kn[found]
+        self.neighborHits += found.sum()
+
+        # global search for everything else
+        lost = (host < 0)
+        lost[walk[~found]] = True
+        lost = lost.nonzero()[0]
+        if (len(lost) > 0):
+            k[lost] = self.fields.locate(X[lost])[0]
+        self.misses += len(lost)
+
+        return k
+
+    def getStatistics(self):
+        return {'hits':self.hits, 'neighbors':self.neighborHits, 'misses':self.misses}
+
+    def resetStatistics(self):
+        self.hits         = 0
+        self.neighborHits = 0
+        self.misses       = 0
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+from numpy.lib.format import open_memmap
+
+from ParticleSet import *
+
+
+class MappedParticleSet(ParticleSet):
+    '''
+    ParticleSet keeping all per-particle arrays in memory-mapped .npy files,
+    for particle counts that do not fit into memory.
+
+    The arrays behave like those of a ParticleSet, and the operating system
+    pages them in and out as needed.  Memory use stays bounded as long as
+    the particles are processed in chunks (see ParticleAdvector.setChunkSize).
+    Operations on all particles at once, like permute(), creationOrder() or
+    trace recording, still need memory proportional to the particle count.
+
+    The file of an array is <directory>/<name>.<capacity>.npy and can be
+    read by numpy.load(..., mmap_mode='r').  A set created without a
+    directory uses a temporary directory that is deleted by close().
+    Worker processes map the same files (getBlock), so a ParallelAdvector
+    advances the particles in place without loading them into memory.
+
+    variables:
+        self.directory
+        self.temporary   # True if self.directory is deleted by close()
+        self.files       = {name: path of the current file}
+
+    methods:
+        def __init__(self, directory=None, capacity=16)
+        def allocate(self, name, shape, dtype)
+        def reserve(self, capacity)
+        def getBlock(self, name)
+        def flush(self)
+        def close(self)
+    '''
+
+    def __init__(self, directory=None, capacity=16):
+        '''
+        Constructor
+        '''
+        self.temporary = (directory is None)
+        if self.temporary:
+            directory = tempfile.mkdtemp(prefix='particles')
+        elif not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self.directory = os.path.abspath(directory)
+        self.files     = {}
+
+        super().__init__(capacity)
+
+    def __str__(self):
+        return "MappedParticleSet({} particles in {})".format(self.nParticles, self.directory)
+
+    def __repr__(self):
+        return "MappedParticleSet('{}', {})".format(self.directory, self.capacity)
+
+    def allocate(self, name, shape, dtype):
+        path = os.path.join(self.directory, "{}.{}.npy".format(name, shape[0]))
+        return open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+
+    def reserve(self, capacity):
+        if (capacity <= self.capacity):
+            return
+
+        super().reserve(capacity)
+
+        # the data have been copied to the new files
+        for name in self.slotFields + ('handleOf', 'slotOf'):
+            path = getattr(self, name).filename
+            if (self.files.get(name, path) != path):
+                os.remove(self.files[name])
+            self.files[name] = path
+
+    def getBlock(self, name):
+        a = getattr(self, name)
+        return (name, 'file', a.filename, a.shape, a.dtype.str)
+
+    def flush(self):
+        for name in self.slotFields + ('handleOf', 'slotOf'):
+            getattr(self, name).flush()
+
+    def close(self):
+        # release the mappings; the set is empty afterwards
+        for name in self.slotFields + ('handleOf', 'slotOf'):
+            setattr(self, name, getattr(self, name)[:0].copy())
+        self.nParticles = 0
+        self.capacity   = 0
+        self.order      = None
+
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.files = {}
@@ -8,9 +8,16 @@ from numpy.linalg import norm
 from scipy.linalg import expm
 from math import pi
 
+from GridState import *
+
 class Node(object):
     '''
+    A node is a light-weight view onto one entry of a GridState.
+    All nodal fields are stored in the grid arrays at index [j,i].
+
     variables:
+        self.grid = GridState  # shared storage of nodal fields
+        self.index = (j,i)     # array index into self.grid
         self.id = id
         self.pos = array([X,Y])
         self.force = zeros(2)
@@ -27,7 +34,7 @@ class Node(object):
         self.gridCoords = (i,j)
     
     methods:
-        def __init__(self, id, X,Y)
+        def __init__(self, id, X,Y, grid=None, i=0, j=0)
         def __str__(self)
         def __repr__(self)
         def wipe(self)
@@ -57,30 +64,93 @@ class Node(object):
     '''
 
 
-    def __init__(self, id, X,Y):
+    def __init__(self, id, X,Y, grid=None, i=0, j=0):
         '''
         Constructor
         '''
+        if (grid is None):
+            # a stand-alone node owns a grid of a single node
+            grid = GridState(1,1)
+            i = 0
+            j = 0
+        
+        self.grid  = grid
+        self.index = (j,i)
+        
         self.id = id
         self.gridCoords = ()
         
-        self.pos = array([X,Y])
-        
-        self.force = zeros(2)
+        self.grid.position[j,i] = array([X,Y])
         
-        self.mass = 1.e-16
-        self.momentum = zeros(2)
-        self.appAccel = zeros(2)
-        self.pressure = 0.0
-        
-        self.aStar  = zeros(2)
         self.aTilde = zeros(2)
         self.ahat   = zeros(2)  # should always remain zero for interpolation purposes
         
         self.lastX = self.pos   # last converged position
         self.lastV = zeros(2)   # last converged velocity
-        
-        self.fixety = dict()
+    
+    # nodal fields are stored in the grid
+    @property
+    def pos(self):
+        return self.grid.position[self.index]
+    
+    @property
+    def mass(self):
+        return self.grid.mass[self.index]
+    
+    @mass.setter
+    def mass(self, m):
+        self.grid.mass[self.index] = m
+        self.grid.touchVelocity()
+    
+    @property
+    def momentum(self):
+        return self.grid.momentum[self.index]
+    
+    @momentum.setter
+    def momentum(self, p):
+        self.grid.momentum[self.index] = p
+        self.grid.touchVelocity()
+    
+    @property
+    def force(self):
+        return self.grid.force[self.index]
+    
+    @force.setter
+    def force(self, F):
+        self.grid.force[self.index] = F
+    
+    @property
+    def pressure(self):
+        return self.grid.pressure[self.index]
+    
+    @pressure.setter
+    def pressure(self, p):
+        self.grid.pressure[self.index] = p
+    
+    @property
+    def appAccel(self):
+        return self.grid.appAccel[self.index]
+    
+    @appAccel.setter
+    def appAccel(self, a):
+        self.grid.appAccel[self.index] = a
+        self.grid.touchAccel()
+    
+    @property
+    def aStar(self):
+        return self.grid.aStar[self.index]
+    
+    @aStar.setter
+    def aStar(self, a):
+        self.grid.aStar[self.index] = a
+    
+    @property
+    def fixety(self):
+        fixety = dict()
+        for dof in range(2):
+            if self.grid.fixed[self.index][dof]:
+                fixety[dof] = self.grid.fixedValue[self.index][dof]
+        return fixety
     
     def __str__(self):
         s = "   node({}/{}):  x=[{},{}], mass={}, p=[{},{}], v=[{},{}]".format(*self.gridCoords,
@@ -95,7 +165,11 @@ class Node(object):
         return s
 
     def wipe(self):
-        self.mass = 0.0
+        lumpedMass = self.grid.getLumpedMass()
+        if (lumpedMass is None):
+            self.mass = 0.0
+        else:
+            self.mass = lumpedMass[self.index]
         self.momentum = 0.0
         self.force = zeros(2)
         
@@ -131,10 +205,12 @@ class Node(object):
         
     def addVelocity(self, dv):
         # check for boundary conditions !!!!
-        if (not 0 in self.fixety):
+        fixed = self.grid.fixed[self.index]
+        if (not fixed[0]):
             self.momentum[0] += self.mass*dv[0]
-        if (not 1 in self.fixety):
+        if (not fixed[1]):
             self.momentum[1] += self.mass*dv[1]
+        self.grid.touchVelocity()
         
     def getVelocity(self):
         if (self.mass > 0.0):
@@ -171,7 +247,8 @@ class Node(object):
         return fixeties.copy()
     
     def fixDOF(self, dof, val=0.0):
-        self.fixety[dof] = val
+        self.grid.fixed[self.index][dof]      = True
+        self.grid.fixedValue[self.index][dof] = val
        
     def updateVstar(self, dt):
         # apply boundary condition
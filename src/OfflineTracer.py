@@ -0,0 +1,185 @@
+import os
+import re
+import numpy as np
+
+from ElementKernel import *
+from AdvectionFields import *
+from ParticleAdvector import *
+from ParallelAdvector import *
+from SharedParticleSet import *
+from ButcherTableau import *
+
+
+class OfflineTracer(object):
+    '''
+    Advection of particles through the nodal fields stored by Writer.writeData,
+    without solving the flow again.
+
+    Snapshots k and k+1 at times t_k < t_k+1 are interpolated linearly in
+    time.  A step starting at t uses the velocity interpolated to t; the
+    change within the step enters through the apparent acceleration, as in
+    the coupled run (ParticleAdvector evaluates v + a*accel at the stages).
+    The apparent acceleration is the stored one (ax###.txt, ay###.txt),
+    interpolated to t, or -- if not stored or useStoredAccel is False --
+    the slope (v_k+1 - v_k)/(t_k+1 - t_k), which makes the stage
+    velocities the exact linear interpolant in time.  Before the first and
+    after the last snapshot the fields are held constant.
+
+    Any ButcherTableau may be used.  With nWorkers > 1 the particles are
+    advanced in chunks by a ParallelAdvector; a set the workers cannot map
+    is copied into a SharedParticleSet for the duration of advect().
+
+    variables:
+        self.directory
+        self.times     = (nSnapshots,)
+        self.velocity  = (nSnapshots, nNodesY, nNodesX, 2)
+        self.accel     = (nSnapshots, nNodesY, nNodesX, 2), or None if not stored
+        self.useStoredAccel = True
+        self.useEnhanced    = False
+        self.kernel    = ElementKernel
+        self.centers   = (nCells, 2)
+        self.advector  = ParticleAdvector or ParallelAdvector
+
+    methods:
+        def __init__(self, directory='data', scheme=ExplicitEuler(), nWorkers=1, chunkSize=None)
+        def load(self)
+        def setTimeIntegrator(self, scheme)
+        def setAcceleration(self, useStoredAccel=True)
+        def setEnhanced(self, useEnhanced=True)
+        def getTimeRange(self)
+        def fieldsAt(self, time)                 # AdvectionFields at time
+        def advect(self, pset, t0, t1, dt)       # advance ParticleSet pset from t0 to t1
+        def close(self)
+    '''
+
+    def __init__(self, directory='data', scheme=ExplicitEuler(), nWorkers=1, chunkSize=None):
+        '''
+        Constructor
+        '''
+        self.directory = directory
+        self.useStoredAccel = True
+        self.useEnhanced    = False
+
+        if (nWorkers > 1):
+            self.advector = ParallelAdvector(scheme, nWorkers, chunkSize)
+        else:
+            self.advector = ParticleAdvector(scheme, chunkSize)
+
+        self.load()
+
+    def __str__(self):
+        return "OfflineTracer({} snapshots in '{}', t={}..{})".format(len(self.times), self.directory, *self.getTimeRange())
+
+    def load(self):
+        X = np.loadtxt(os.path.join(self.directory, 'nodeXcoordinates.txt'), ndmin=2)
+        Y = np.loadtxt(os.path.join(self.directory, 'nodeYcoordinates.txt'), ndmin=2)
+        nNodesY, nNodesX = X.shape
+        hx = (X[0,-1] - X[0,0]) / (nNodesX - 1)
+        hy = (Y[-1,0] - Y[0,0]) / (nNodesY - 1)
+
+        self.kernel = ElementKernel(hx, hy, nNodesX - 1, nNodesY - 1)
+
+        # cell centers in cell id order, k = nCellsY*i + j
+        corners = np.stack((X, Y), -1)
+        self.centers = self.kernel.gather(corners).mean(axis=1)
+
+        def read(name):
+            fname = os.path.join(self.directory, name)
+            with open(fname) as f:
+                time = float(re.search(r't=([-+0-9.eE]+)s', f.readline()).group(1))
+            return time, np.loadtxt(fname, ndmin=2)
+
+        numbers = sorted(int(f[2:-4]) for f in os.listdir(self.directory) if re.fullmatch(r'vx\d+\.txt', f))
+        if (len(numbers) == 0):
+            raise ValueError("no velocity snapshots in '{}'".format(self.directory))
+
+        times    = []
+        velocity = []
+        accel    = []
+        for k in numbers:
+            t, vx = read("vx{:03d}.txt".format(k))
+            t, vy = read("vy{:03d}.txt".format(k))
+            times.append(t)
+            velocity.append(np.stack((vx, vy), -1))
+
+            if (accel is not None and os.path.exists(os.path.join(self.directory, "ax{:03d}.txt".format(k)))):
+                t, ax = read("ax{:03d}.txt".format(k))
+                t, ay = read("ay{:03d}.txt".format(k))
+                accel.append(np.stack((ax, ay), -1))
+            else:
+                accel = None
+
+        order = np.argsort(times, kind='stable')
+        self.times    = np.array(times)[order]
+        self.velocity = np.array(velocity)[order]
+        self.accel    = np.array(accel)[order] if accel is not None else None
+
+    def setTimeIntegrator(self, scheme):
+        self.advector.setTimeIntegrator(scheme)
+
+    def setAcceleration(self, useStoredAccel=True):
+        self.useStoredAccel = useStoredAccel
+
+    def setEnhanced(self, useEnhanced=True):
+        self.useEnhanced = useEnhanced
+
+    def getTimeRange(self):
+        return self.times[0], self.times[-1]
+
+    def fieldsAt(self, time):
+        times = self.times
+        k = min(max(np.searchsorted(times, time, side='right') - 1, 0), max(len(times) - 2, 0))
+
+        if (len(times) > 1):
+            span = times[k+1] - times[k]
+            w = min(max((time - times[k]) / span, 0.0), 1.0)
+            vel = (1. - w)*self.velocity[k] + w*self.velocity[k+1]
+        else:
+            span = 0.0
+            w = 0.0
+            vel = self.velocity[k]
+
+        # the fields are held constant outside the stored time range
+        if (span > 0.0 and times[0] <= time < times[-1]):
+            if (self.useStoredAccel and self.accel is not None):
+                accel = (1. - w)*self.accel[k] + w*self.accel[k+1]
+            else:
+                accel = (self.velocity[k+1] - self.velocity[k]) / span
+        else:
+            accel = np.zeros_like(vel)
+
+        vel   = self.kernel.gather(vel)
+        accel = self.kernel.gather(accel)
+        ux = vel[:,:,0]
+        uy = vel[:,:,1]
+        divVa, divVb, divVc = self.kernel.cellDivergence(ux, uy)
+
+        fields = AdvectionFields(self.kernel, self.centers)
+        fields.setVelocity(ux, uy, divVb, divVc)
+        fields.setAcceleration(accel[:,:,0], accel[:,:,1])
+        fields.setEnhanced(self.useEnhanced)
+        fields.setTime(time)
+        return fields
+
+    def advect(self, pset, t0, t1, dt):
+        nSteps = max(int(np.ceil((t1 - t0)/dt - 1e-9)), 1)
+        dt = (t1 - t0) / nSteps
+
+        work = pset
+        if (isinstance(self.advector, ParallelAdvector) and pset.getBlock('position') is None):
+            work = pset.copy(SharedParticleSet())
+
+        for n in range(nSteps):
+            time = t0 + n*dt
+            self.advector.advance(work, self.fieldsAt(time), dt)
+            work.recordTraces(time + dt)
+
+        if (work is not pset):
+            work.copy(pset)
+            work.close()
+
+        return pset
+
+    def close(self):
+        if isinstance(self.advector, ParallelAdvector):
+            self.advector.close()
@@ -0,0 +1,192 @@
+from numpy import ndarray, dtype, isscalar
+from numpy.lib.format import open_memmap
+from multiprocessing import Pool, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+
+from ParticleAdvector import *
+from AdvectionFields import *
+from ParticleSet import *
+
+
+# arrays shared with the workers, in the order of a shard task
+fieldNames    = ('ux', 'uy', 'ax', 'ay', 'divVb', 'divVc')
+particleNames = ('position', 'velocity', 'deformationGradient')
+
+
+class ParallelAdvector(ParticleAdvector):
+    '''
+    ParticleAdvector running on a persistent pool of worker processes.
+
+    The particles must live in storage the workers can map: a
+    SharedParticleSet (shared memory) or a MappedParticleSet (files).  The
+    workers attach to the position, velocity and deformation gradient
+    arrays of the set once (again only after the set grew) and advance
+    their slot range in place, so no particle data are copied.  Once per
+    advance() the cell fields are copied into shared memory blocks.  The
+    particles are split into one shard per worker (at most chunkSize
+    particles each); only block names, shapes and slot ranges are sent to
+    the workers.
+
+    As in ParticleAdvector, dt and t0 may be given per particle; every
+    shard carries its part of them.  Particles are independent, so results
+    agree exactly with ParticleAdvector.
+
+    variables:
+        self.nWorkers
+        self.pool      # multiprocessing.Pool, started by the first advance()
+        self.geometry  # (kernel, centers) the pool was started with
+        self.blocks    = {name: (SharedMemory, array)}   # cell fields
+
+    methods:
+        def __init__(self, scheme=ExplicitEuler(), nWorkers=2, chunkSize=None)
+        def setWorkers(self, nWorkers)
+        def share(self, name, data)          # copy data into the shared block name; returns its description
+        def advance(self, pset, fields, dt, start=0, stop=None, t0=0.0)
+        def close(self)                      # stop the workers and release the shared memory
+    '''
+
+    def __init__(self, scheme=ExplicitEuler(), nWorkers=2, chunkSize=None):
+        '''
+        Constructor
+        '''
+        super().__init__(scheme, chunkSize)
+        self.nWorkers = nWorkers
+        self.pool     = None
+        self.geometry = None
+        self.blocks   = {}
+
+    def __str__(self):
+        return "ParallelAdvector({}, {} workers)".format(self.scheme, self.nWorkers)
+
+    def __del__(self):
+        self.close()
+
+    def setWorkers(self, nWorkers):
+        if (nWorkers != self.nWorkers):
+            self.close()
+        self.nWorkers = nWorkers
+
+    def share(self, name, data):
+        # blocks are re-used as long as they are large enough
+        block, array = self.blocks.get(name, (None, None))
+        if (block is None or block.size < data.nbytes):
+            if (block is not None):
+                block.close()
+                block.unlink()
+            block = SharedMemory(create=True, size=max(data.nbytes, 1))
+
+        array = ndarray(data.shape, dtype=data.dtype, buffer=block.buf)
+        array[...] = data
+        self.blocks[name] = (block, array)
+
+        return (name, 'shm', block.name, data.shape, data.dtype.str)
+
+    def advance(self, pset, fields, dt, start=0, stop=None, t0=0.0):
+        if (stop is None):
+            stop = len(pset)
+        if (stop <= start):
+            return
+
+        particleBlocks = [pset.getBlock(name) for name in particleNames]
+        if (None in particleBlocks):
+            raise ValueError("parallel advection needs a SharedParticleSet or MappedParticleSet, not {}".format(repr(pset)))
+
+        if (self.pool is None or self.geometry[0] is not fields.kernel or self.geometry[1] is not fields.centers):
+            self.close()
+            self.geometry = (fields.kernel, fields.centers)
+            # workers must share our resource tracker, otherwise they unlink the blocks on exit
+            resource_tracker.ensure_running()
+            self.pool = Pool(self.nWorkers, initializer=initWorker, initargs=self.geometry)
+
+        tic = perf_counter()
+
+        fieldBlocks = [self.share(name, getattr(fields, name)) for name in fieldNames]
+
+        nP    = stop - start
+        shard = -(-nP // self.nWorkers)
+        if (self.chunkSize):
+            shard = min(shard, self.chunkSize)
+
+        part  = lambda v, first: v if isscalar(v) else v[first - start:min(first + shard, stop) - start]
+        tasks = [(self.scheme, part(dt, first), part(t0, first), fields.useEnhanced, fieldBlocks, particleBlocks,
+                  first, min(first + shard, stop))
+                 for first in range(start, stop, shard)]
+        outside = sum(self.pool.map(advanceShard, tasks))
+
+        self.elapsed += perf_counter() - tic
+        self.particleCount += nP
+
+        self.outsideCount = outside
+        if (outside > 0):
+            print("warning: {} particle positions outside their cell".format(outside))
+
+    def close(self):
+        if (self.pool is not None):
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        for block, array in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks = {}
+
+
+# ====== worker processes ========
+
+workerState = {}
+
+
+def initWorker(kernel, centers):
+    workerState['fields']   = AdvectionFields(kernel, centers)
+    workerState['advector'] = ParticleAdvector()
+    workerState['blocks']   = {}
+    workerState['stale']    = []
+
+
+def attach(description):
+    # arrays on shared memory blocks or mapped files, attached once per block
+    name, kind, location, shape, dt = description
+    blocks = workerState['blocks']
+    stale  = workerState['stale']
+    if (name not in blocks or blocks[name][0] != location):
+        if (name in blocks and blocks[name][1] is not None):
+            stale.append(blocks[name][1])
+        if (kind == 'shm'):
+            block = SharedMemory(name=location)
+            blocks[name] = (location, block, None)
+        else:
+            blocks[name] = (location, None, open_memmap(location, mode='r+'))
+
+    # blocks replaced by larger ones are closed once no array uses them
+    for old in stale[:]:
+        try:
+            old.close()
+            stale.remove(old)
+        except BufferError:
+            pass
+
+    location, block, array = blocks[name]
+    if (array is not None):
+        return array
+    return ndarray(shape, dtype=dtype(dt), buffer=block.buf)
+
+
+def advanceShard(task):
+    scheme, dt, t0, useEnhanced, fieldBlocks, particleBlocks, start, stop = task
+
+    fields = workerState['fields']
+    fields.setVelocity(*[attach(b) for b in (fieldBlocks[0], fieldBlocks[1], fieldBlocks[4], fieldBlocks[5])])
+    fields.setAcceleration(attach(fieldBlocks[2]), attach(fieldBlocks[3]))
+    fields.setEnhanced(useEnhanced)
+
+    # a ParticleSet working on the shared particle arrays; slots start ... stop-1 are advanced
+    pset = ParticleSet(1)
+    for name, block in zip(particleNames, particleBlocks):
+        setattr(pset, name, attach(block))
+    pset.nParticles = len(pset.position)
+
+    advector = workerState['advector']
+    advector.setTimeIntegrator(scheme)
+    return advector.advanceChunk(pset, fields, dt, start, stop, t0)
@@ -4,12 +4,24 @@ Created on Jun 10, 2018
 @author: pmackenz
 '''
 
-from numpy import array, ones, zeros, identity
-import globalCounter as GC
+from numpy import array, zeros, identity
+from warnings import warn
+
+from ParticleSet import *
 
 class Particle(object):
     '''
+    A particle is a light-weight view onto one entry of a ParticleSet.
+    All particle fields are stored in the set's arrays; self.handle is
+    resolved to the current storage slot on every access.
+
+    Traces are recorded only by the Domain (ParticleSet.recordTraces after
+    each particle update); moving a particle on its own, e.g. through the
+    deprecated addToPosition(), records nothing.
+
     variables:
+        self.pset   = ParticleSet  # shared storage of particle fields
+        self.handle                # stable handle into self.pset
         self.id    = ParticleID
         self.mass  = mp
         self.pos   = xp
@@ -22,47 +34,160 @@ class Particle(object):
         self.strainRate = zeros(3)
         self.deformationGradient = identity(2)
         self.recordParticleTrace = False
-        self.posTrace = []
+        self.posTrace              # view of the recorded trace (see TrajectoryStore)
+        self.hostCell = -1         # id of the cell holding this particle
     
     methods:
-        def __init__(self, mp=1.0, xp=zeros(2), vp=zeros(2))
+        def __init__(self, mp=1.0, xp=zeros(2), vp=zeros(2), pset=None, handle=None, particleID=None)
         def setViscosity(self, mu)
         def setVelocity(self, v)
         def addToVelocity(self, dv)
-        def addToPosition(self, dx)
+        def addToPosition(self, dx)   # deprecated, records no trace
         def velocity(self)      # return particle velocity
         def position(self)      # return particle position
-        def mass(self)          # return particle mass
-        def strain(self)        # return particle strain
-        def strainRate(self)    # return rate of deformation tensor
-        def stress(self)        # return particle stress
+        def getMass(self)       # return particle mass
+        def getStrain(self)     # return particle strain
+        def getStrainRate(self) # return rate of deformation tensor
+        def getStress(self)     # return particle stress
+        def setDeformationGradient(self, newValue)
+        def getDeformationGradient(self)
         def trace(self, OnOff)  # turn particle trace on and off
         def getTrace(self)      # return a reference to the particle trace
     '''
 
-    def __init__(self, mp=1.0, xp=zeros(2), vp=zeros(2)):
+    def __init__(self, mp=1.0, xp=zeros(2), vp=zeros(2), pset=None, handle=None, particleID=None):
         '''
         Constructor
         '''
-        # assign a unique ID
-        GC.ParticleID += 1
-        self.id    = GC.ParticleID
-        
-        self.mass  = mp
-        self.pos   = xp
-        self.vel   = vp
-        self.accel = zeros(2)
-        
-        self.mu = 0.0;
-        
-        self.stress = zeros(3)
-        self.strain = zeros(3)
-        self.p      = 0.0
-        self.strainRate = zeros(3)
-        self.deformationGradient = identity(2)
+        if (pset is None):
+            # a stand-alone particle owns a set of a single particle
+            # (this also assigns a unique ID, unless particleID is given)
+            pset = ParticleSet(1)
+            slot = pset.addParticles(mp, xp, vp, ids=particleID)[0]
+            handle = pset.handleOf[slot]
 
-        self.recordParticleTrace = False
-        self.posTrace = []
+        self.pset   = pset
+        self.handle = handle
+
+    def __str__(self):
+        return "Particle {}: x={}, v={}".format(self.id, self.pos, self.vel)
+
+    def __repr__(self):
+        return "Particle({},{},{})".format(self.mass, self.pos, self.vel)
+
+    def __eq__(self, other):
+        return isinstance(other, Particle) and self.pset is other.pset and self.handle == other.handle
+
+    def __hash__(self):
+        return hash((id(self.pset), self.handle))
+
+    @property
+    def slot(self):
+        return self.pset.slotOf[self.handle]
+
+    @property
+    def id(self):
+        return self.pset.id[self.slot]
+
+    @property
+    def mass(self):
+        return self.pset.mass[self.slot]
+
+    @mass.setter
+    def mass(self, mp):
+        self.pset.mass[self.slot] = mp
+
+    @property
+    def pos(self):
+        return self.pset.position[self.slot]
+
+    @pos.setter
+    def pos(self, xp):
+        self.pset.position[self.slot] = xp
+
+    @property
+    def vel(self):
+        return self.pset.velocity[self.slot]
+
+    @vel.setter
+    def vel(self, vp):
+        self.pset.velocity[self.slot] = vp
+
+    @property
+    def accel(self):
+        return self.pset.accel[self.slot]
+
+    @accel.setter
+    def accel(self, a):
+        self.pset.accel[self.slot] = a
+
+    @property
+    def mu(self):
+        return self.pset.viscosity[self.slot]
+
+    @mu.setter
+    def mu(self, mu):
+        self.pset.viscosity[self.slot] = mu
+
+    @property
+    def p(self):
+        return self.pset.pressure[self.slot]
+
+    @p.setter
+    def p(self, p):
+        self.pset.pressure[self.slot] = p
+
+    @property
+    def strain(self):
+        return self.pset.strain[self.slot]
+
+    @strain.setter
+    def strain(self, eps):
+        self.pset.strain[self.slot] = eps
+
+    @property
+    def strainRate(self):
+        return self.pset.strainRate[self.slot]
+
+    @strainRate.setter
+    def strainRate(self, D):
+        self.pset.strainRate[self.slot] = D
+
+    @property
+    def stress(self):
+        return self.pset.stress[self.slot]
+
+    @stress.setter
+    def stress(self, sig):
+        self.pset.stress[self.slot] = sig
+
+    @property
+    def deformationGradient(self):
+        return self.pset.deformationGradient[self.slot]
+
+    @deformationGradient.setter
+    def deformationGradient(self, F):
+        self.pset.deformationGradient[self.slot] = F
+
+    @property
+    def recordParticleTrace(self):
+        return self.pset.recordTrace[self.slot]
+
+    @recordParticleTrace.setter
+    def recordParticleTrace(self, OnOff):
+        self.pset.recordTrace[self.slot] = OnOff
+
+    @property
+    def hostCell(self):
+        return self.pset.hostCell[self.slot]
+
+    @hostCell.setter
+    def hostCell(self, k):
+        self.pset.hostCell[self.slot] = k
+
+    @property
+    def posTrace(self):
+        return self.pset.trajectories.getTrace(self.handle)
         
     def setViscosity(self, mu):
         self.mu = mu;
@@ -77,23 +202,24 @@ class Particle(object):
         return self.vel.copy()
     
     def addToPosition(self, dx):
+        warn("Particle.addToPosition is deprecated and records no trace; "
+             "traces are recorded by the Domain through ParticleSet.recordTraces",
+             DeprecationWarning, stacklevel=2)
         self.pos += dx
-        if self.recordParticleTrace:
-            self.posTrace.append(self.pos.copy())
         
     def position(self):
         return self.pos.copy()
     
-    def mass(self):
+    def getMass(self):
         return self.mass
     
-    def strain(self):
+    def getStrain(self):
         return self.strain.copy()
     
-    def strainRate(self):
+    def getStrainRate(self):
         return self.strainRate.copy()
     
-    def stress(self):
+    def getStress(self):
         stress = array([
                         2.*self.mu*self.strainRate[0] - self.p,
                         2.*self.mu*self.strainRate[1] - self.p,
@@ -110,7 +236,7 @@ class Particle(object):
     def trace(self, OnOff):
         self.recordParticleTrace = OnOff
         if not OnOff:
-            self.posTrace = []
+            self.pset.trajectories.stopTrace(self.handle)
 
     def getTrace(self):
-        return self.posTrace
\ No newline at end of file
+        return self.posTrace
@@ -0,0 +1,118 @@
+from numpy import arange, argsort, where, zeros_like, int64
+
+
+class ParticleOrdering(object):
+    '''
+    Periodic re-ordering of particle storage along a space-filling curve.
+
+    Every cell gets the key of its grid coordinates (i,j) along a Morton
+    (Z-order) or Hilbert curve, and particles are sorted by the key of their
+    host cell.  Particles that are close in space then are close in memory,
+    which keeps the gathers of cell data during advection local.
+    Re-ordering only moves storage slots: ids, Particle views and traces
+    are unaffected (see ParticleSet.permute).
+
+    variables:
+        self.nCellsX
+        self.nCellsY
+        self.curve    = 'morton' | 'hilbert'
+        self.interval # re-order every interval steps (0 = never)
+        self.steps    # steps since the last re-ordering
+        self.cellKeys = (nCells,)   # curve index of every cell
+        self.reorderCount
+
+    methods:
+        def __init__(self, nCellsX, nCellsY, curve='morton', interval=0)
+        def setCurve(self, curve)
+        def setInterval(self, interval)
+        def mortonKeys(self, i, j)
+        def hilbertKeys(self, i, j)
+        def isDue(self)               # counts a step; True if a re-ordering is due
+        def reorder(self, pset)
+    '''
+
+    def __init__(self, nCellsX, nCellsY, curve='morton', interval=0):
+        '''
+        Constructor
+        '''
+        self.nCellsX = nCellsX
+        self.nCellsY = nCellsY
+        self.steps   = 0
+        self.reorderCount = 0
+
+        self.setInterval(interval)
+        self.setCurve(curve)
+
+    def __str__(self):
+        return "ParticleOrdering({}, every {} steps)".format(self.curve, self.interval)
+
+    def setCurve(self, curve):
+        # cell id k = nCellsY*i + j
+        k = arange(self.nCellsX*self.nCellsY)
+        i = k // self.nCellsY
+        j = k %  self.nCellsY
+
+        if (curve == 'morton'):
+            self.cellKeys = self.mortonKeys(i, j)
+        elif (curve == 'hilbert'):
+            self.cellKeys = self.hilbertKeys(i, j)
+        else:
+            raise ValueError("unknown space-filling curve '{}'".format(curve))
+        self.curve = curve
+
+    def setInterval(self, interval):
+        self.interval = interval
+        self.steps    = 0
+
+    def mortonKeys(self, i, j):
+        # interleave the bits of i (even bits) and j (odd bits)
+        def spread(v):
+            v = v.astype(int64) & 0xFFFFFFFF
+            v = (v | (v << 16)) & 0x0000FFFF0000FFFF
+            v = (v | (v <<  8)) & 0x00FF00FF00FF00FF
+            v = (v | (v <<  4)) & 0x0F0F0F0F0F0F0F0F
+            v = (v | (v <<  2)) & 0x3333333333333333
+            v = (v | (v <<  1)) & 0x5555555555555555
+            return v
+        return spread(i) | (spread(j) << 1)
+
+    def hilbertKeys(self, i, j):
+        n = 1
+        while (n < max(self.nCellsX, self.nCellsY)):
+            n *= 2
+
+        x = i.astype(int64).copy()
+        y = j.astype(int64).copy()
+        d = zeros_like(x)
+
+        s = n // 2
+        while (s > 0):
+            rx = (x & s) > 0
+            ry = (y & s) > 0
+            d += s * s * ((3 * rx) ^ ry)
+
+            # rotate the quadrant
+            flip = ~ry & rx
+            x = where(flip, n-1 - x, x)
+            y = where(flip, n-1 - y, y)
+            x, y = where(~ry, y, x), where(~ry, x, y)
+
+            s //= 2
+
+        return d
+
+    def isDue(self):
+        if (self.interval <= 0):
+            return False
+
+        self.steps += 1
+        if (self.steps >= self.interval):
+            self.steps = 0
+            return True
+        return False
+
+    def reorder(self, pset):
+        host = pset.getHostCells()
+        keys = where(host >= 0, self.cellKeys[host], -1)
+        pset.permute(argsort(keys, kind='stable'))
+        self.reorderCount += 1
@@ -0,0 +1,369 @@
+from numpy import zeros, empty, arange, identity, asarray, unique, isin, argsort, inf, int64
+from copy import deepcopy
+import globalCounter as GC
+
+from TrajectoryStore import *
+
+
+class ParticleSet(object):
+    '''
+    Contiguous storage of all particle fields.
+
+    Particle data are kept in arrays that grow by doubling their capacity.
+    Only the first len(self) rows are active.  A Particle is a light-weight
+    view identified by a stable handle; the handle is mapped to the current
+    storage slot through self.slotOf, so the storage may be re-ordered
+    (permute) without invalidating views.  Arrays obtained from a view or
+    from the get...() methods become stale once the set grows.
+
+    The set works as a pool: remove() fills the holes with the last active
+    particles, so the active rows stay contiguous, and the handles of the
+    removed particles are parked in the free slots for re-use by the next
+    additions.  Views of removed particles must not be used any more.
+
+    The get...() methods return arrays in storage order, and getIDs()
+    gives the matching particle ids.  Iteration and indexing follow the
+    order of creation (increasing id), independent of the storage order.
+
+    Particle ids are drawn from globalCounter.ParticleID as before, unless
+    addParticles is given the ids of existing particles.
+
+    Subclasses may keep the arrays elsewhere by overriding allocate(), e.g.
+    on disk (MappedParticleSet) or in shared memory (SharedParticleSet);
+    getBlock() then tells other processes where to find them.
+
+    variables:
+        self.nParticles
+        self.capacity
+        self.id                  = (capacity,)        # particle id
+        self.mass                = (capacity,)
+        self.position            = (capacity, 2)
+        self.velocity            = (capacity, 2)
+        self.accel               = (capacity, 2)
+        self.deformationGradient = (capacity, 2, 2)
+        self.stress              = (capacity, 3)
+        self.strain              = (capacity, 3)
+        self.strainRate          = (capacity, 3)
+        self.pressure            = (capacity,)
+        self.viscosity           = (capacity,)
+        self.recordTrace         = (capacity,)        # bool
+        self.hostCell            = (capacity,)        # id of the cell holding the particle, or -1
+        self.birth               = (capacity,)        # time the particle was created
+        self.lifetime            = (capacity,)        # time after which the particle is retired (inf = never)
+        self.trajectories        = TrajectoryStore   # traces of the particles with recordTrace set
+        self.handleOf            = (capacity,)        # slot -> handle
+        self.slotOf              = (capacity,)        # handle -> slot
+        self.order               # handles in order of creation (cached, None if outdated)
+
+    methods:
+        def __init__(self, capacity=16)
+        def __len__(self)
+        def __iter__(self)
+        def __getitem__(self, k)                                  # k-th particle in order of creation
+        def view(self, slot)                                      # Particle stored in slot
+        def reserve(self, capacity)
+        def reserveHandles(self, capacity)                        # grow the handle maps (called by reserve)
+        def allocate(self, name, shape, dtype)                    # storage for one per-particle array
+        def getBlock(self, name)                                  # where other processes find an array (None = private)
+        def copy(self, out=None)                                  # copy of the set, into the (empty) set out if given
+        def addParticle(self, mp=1.0, xp=zeros(2), vp=zeros(2))   # returns a Particle
+        def addParticles(self, mp, X, V=None, ids=None)           # returns the new slots; ids=None draws new ids
+        def remove(self, slots)                                   # returns the removed handles
+        def creationOrder(self)                                   # handles in order of creation
+        def append(self, particle)                                # adopt a stand-alone Particle
+        def addToPositions(self, dX, start=0, stop=None)
+        def recordTraces(self, time)                              # store a trace frame of the traced particles
+        def getTraces(self)                                       # (nFrames, nTraced, 2) in order of creation
+        def permute(self, order)                                  # slot s receives the particle of slot order[s]
+        def slot(self, handle)
+        def getIDs(self)
+        def getMasses(self)
+        def getPositions(self)
+        def getVelocities(self)
+        def getDeformationGradients(self)
+        def getHostCells(self)
+        def setViscosity(self, mu)
+        def trace(self, OnOff)
+    '''
+
+    # per-particle arrays, indexed by storage slot
+    slotFields = ('id', 'mass', 'position', 'velocity', 'accel', 'deformationGradient',
+                  'stress', 'strain', 'strainRate', 'pressure', 'viscosity',
+                  'recordTrace', 'hostCell', 'birth', 'lifetime')
+
+    def __init__(self, capacity=16):
+        '''
+        Constructor
+        '''
+        self.nParticles = 0
+        self.capacity   = 0
+
+        self.id                  = zeros(0, dtype=int64)
+        self.mass                = zeros(0)
+        self.position            = zeros((0,2))
+        self.velocity            = zeros((0,2))
+        self.accel               = zeros((0,2))
+        self.deformationGradient = zeros((0,2,2))
+        self.stress              = zeros((0,3))
+        self.strain              = zeros((0,3))
+        self.strainRate          = zeros((0,3))
+        self.pressure            = zeros(0)
+        self.viscosity           = zeros(0)
+        self.recordTrace         = zeros(0, dtype=bool)
+        self.hostCell            = zeros(0, dtype=int64)
+        self.birth               = zeros(0)
+        self.lifetime            = zeros(0)
+        self.trajectories        = TrajectoryStore()
+
+        self.handleOf = zeros(0, dtype=int64)
+        self.slotOf   = zeros(0, dtype=int64)
+        self.order    = None
+
+        self.reserve(max(capacity, 1))
+
+    def __str__(self):
+        return "ParticleSet({} particles)".format(self.nParticles)
+
+    def __repr__(self):
+        return "ParticleSet({})".format(self.capacity)
+
+    def __len__(self):
+        return self.nParticles
+
+    def __iter__(self):
+        # iterate in order of creation; views are created on the fly
+        for k in range(self.nParticles):
+            yield self[k]
+
+    def __getitem__(self, k):
+        from Particle import Particle
+
+        if (k < 0):
+            k += self.nParticles
+        if (k < 0 or k >= self.nParticles):
+            raise IndexError("particle index out of range")
+        return Particle(pset=self, handle=self.creationOrder()[k])
+
+    def view(self, slot):
+        from Particle import Particle
+
+        return Particle(pset=self, handle=self.handleOf[slot])
+
+    def reserve(self, capacity):
+        if (capacity <= self.capacity):
+            return
+
+        n = self.nParticles
+
+        def grow(name, fill=0):
+            a = getattr(self, name)
+            b = self.allocate(name, (capacity,) + a.shape[1:], a.dtype)
+            b[:n] = a[:n]
+            b[n:] = fill
+            return b
+
+        self.id                  = grow('id', -1)
+        self.mass                = grow('mass')
+        self.position            = grow('position')
+        self.velocity            = grow('velocity')
+        self.accel               = grow('accel')
+        self.deformationGradient = grow('deformationGradient', identity(2))
+        self.stress              = grow('stress')
+        self.strain              = grow('strain')
+        self.strainRate          = grow('strainRate')
+        self.pressure            = grow('pressure')
+        self.viscosity           = grow('viscosity')
+        self.recordTrace         = grow('recordTrace', False)
+        self.hostCell            = grow('hostCell', -1)
+        self.birth               = grow('birth')
+        self.lifetime            = grow('lifetime', inf)
+
+        self.reserveHandles(capacity)
+        self.capacity = capacity
+
+    def reserveHandles(self, capacity):
+        # handleOf and slotOf remain inverse permutations of 0 ... capacity-1:
+        # all entries below the old capacity are kept, including the free
+        # handles parked in the free slots by remove(), and every new slot
+        # receives the handle with its own number
+        old = self.capacity
+        handleOf = self.allocate('handleOf', (capacity,), int64)
+        handleOf[:old] = self.handleOf[:old]
+        handleOf[old:] = arange(old, capacity)
+        slotOf = self.allocate('slotOf', (capacity,), int64)
+        slotOf[:old] = self.slotOf[:old]
+        slotOf[old:] = arange(old, capacity)
+        self.handleOf = handleOf
+        self.slotOf   = slotOf
+
+    def allocate(self, name, shape, dtype):
+        # MappedParticleSet and SharedParticleSet override this
+        return empty(shape, dtype=dtype)
+
+    def getBlock(self, name):
+        # (name, kind, location, shape, dtype) for another process; arrays in private memory are not shared
+        return None
+
+    def copy(self, out=None):
+        # handles are kept, so traces and the creation order carry over
+        if (out is None):
+            out = ParticleSet()
+        out.reserve(self.capacity)
+
+        for name in self.slotFields + ('handleOf', 'slotOf'):
+            getattr(out, name)[:self.capacity] = getattr(self, name)
+        out.nParticles   = self.nParticles
+        out.order        = None
+        out.trajectories = deepcopy(self.trajectories)
+
+        return out
+
+    def addParticles(self, mp, X, V=None, ids=None):
+        X = asarray(X, dtype=float).reshape((-1,2))
+        nNew = len(X)
+
+        if (self.nParticles + nNew > self.capacity):
+            self.reserve(max(2*self.capacity, self.nParticles + nNew))
+
+        slots = arange(self.nParticles, self.nParticles + nNew)
+
+        if (ids is None):
+            self.id[slots] = GC.ParticleID + 1 + arange(nNew)
+            GC.ParticleID += nNew
+        else:
+            self.id[slots] = ids
+
+        self.mass[slots]                = mp
+        self.position[slots]            = X
+        self.velocity[slots]            = 0.0 if V is None else V
+        self.accel[slots]               = 0.0
+        self.deformationGradient[slots] = identity(2)
+        self.stress[slots]              = 0.0
+        self.strain[slots]              = 0.0
+        self.strainRate[slots]          = 0.0
+        self.pressure[slots]            = 0.0
+        self.viscosity[slots]           = 0.0
+        self.recordTrace[slots]         = False
+        self.hostCell[slots]            = -1
+        self.birth[slots]               = 0.0
+        self.lifetime[slots]            = inf
+
+        self.nParticles += nNew
+        self.order = None
+
+        return slots
+
+    def addParticle(self, mp=1.0, xp=zeros(2), vp=zeros(2)):
+        from Particle import Particle
+
+        slot = self.addParticles(mp, xp, vp)[0]
+        return Particle(pset=self, handle=self.handleOf[slot])
+
+    def append(self, particle):
+        # adopt a particle owned by another set; the particle keeps its id
+        if (particle.pset is self):
+            return
+
+        old  = particle.pset
+        k    = old.slot(particle.handle)
+        slot = self.addParticles(old.mass[k], old.position[k], old.velocity[k], ids=old.id[k])[0]
+
+        for name in self.slotFields:
+            getattr(self, name)[slot] = getattr(old, name)[k]
+
+        # the trace recorded so far stays with the old set
+        old.trajectories.stopTrace(particle.handle)
+
+        particle.pset   = self
+        particle.handle = self.handleOf[slot]
+
+    def remove(self, slots):
+        slots = unique(asarray(slots, dtype=int64))
+        n     = self.nParticles
+        nNew  = n - len(slots)
+
+        removed = self.handleOf[slots].copy()
+
+        # move the last active particles into the holes
+        holes  = slots[slots < nNew]
+        tail   = arange(nNew, n)
+        movers = tail[~isin(tail, slots)]
+
+        for name in self.slotFields + ('handleOf',):
+            a = getattr(self, name)
+            a[holes] = a[movers]
+        self.slotOf[self.handleOf[holes]] = holes
+
+        # park the free handles in the free slots
+        self.handleOf[nNew:n] = removed
+        self.slotOf[removed]  = tail
+
+        self.trajectories.stopTrace(removed)
+
+        self.nParticles = nNew
+        self.order = None
+
+        return removed
+
+    def creationOrder(self):
+        if (self.order is None):
+            n = self.nParticles
+            self.order = self.handleOf[:n][argsort(self.id[:n], kind='stable')]
+        return self.order
+
+    def addToPositions(self, dX, start=0, stop=None):
+        if (stop is None):
+            stop = self.nParticles
+
+        self.position[start:stop] += dX
+
+    def recordTraces(self, time):
+        traced = self.recordTrace[:self.nParticles].nonzero()[0]
+        if (len(traced) == 0):
+            return
+
+        # only the traced particles are stored, by handle
+        self.trajectories.record(self.handleOf[traced], self.position[traced], time)
+
+    def getTraces(self):
+        order   = self.creationOrder()
+        columns = self.trajectories.getColumns(order)
+        return self.trajectories.getFrames()[:,columns[columns >= 0]]
+
+    def permute(self, order):
+        n = self.nParticles
+
+        for name in self.slotFields + ('handleOf',):
+            a = getattr(self, name)
+            a[:n] = a[:n][order]
+
+        self.slotOf[self.handleOf[:n]] = arange(n)
+
+    def slot(self, handle):
+        return self.slotOf[handle]
+
+    def getIDs(self):
+        return self.id[:self.nParticles]
+
+    def getMasses(self):
+        return self.mass[:self.nParticles]
+
+    def getPositions(self):
+        return self.position[:self.nParticles]
+
+    def getVelocities(self):
+        return self.velocity[:self.nParticles]
+
+    def getDeformationGradients(self):
+        return self.deformationGradient[:self.nParticles]
+
+    def getHostCells(self):
+        return self.hostCell[:self.nParticles]
+
+    def setViscosity(self, mu):
+        self.viscosity[:self.nParticles] = mu
+
+    def trace(self, OnOff):
+        self.recordTrace[:self.nParticles] = OnOff
+        if not OnOff:
+            self.trajectories.clear()
@@ -164,4 +164,7 @@ class Plotter(object):
         
         self.speed = np.sqrt(self.Vx*self.Vx + self.Vy*self.Vy)
         
+    def setGridData(self, grid):
+        self.P, self.Vx, self.Vy, self.Fx, self.Fy, self.Ax, self.Ay, self.speed = grid.getNodalFields()
+        
         
\ No newline at end of file
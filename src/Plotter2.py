@@ -41,6 +41,7 @@ class Plotter(object):
         def refresh(self, time=-1)
         def setGrid(self, nodes)
         def setData(self, nodes)
+        def setGridData(self, grid)
         def setParticleData(self, particles)
         def setCellFluxData(self, cells)
         def plotCellFlux(self, time)
@@ -230,6 +231,11 @@ class Plotter(object):
         
         self.speed = np.sqrt(self.Vx*self.Vx + self.Vy*self.Vy)
         
+    def setGridData(self, grid):
+        self.particlesPresent = False
+        
+        self.P, self.Vx, self.Vy, self.Fx, self.Fy, self.Ax, self.Ay, self.speed = grid.getNodalFields()
+        
     def setParticleData(self, particles):
         if (len(particles) == 0):
             return
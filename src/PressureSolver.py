@@ -0,0 +1,510 @@
+from abc import ABCMeta, abstractmethod
+from inspect import signature
+from numpy import zeros, tile, diag, full, ones
+from numpy.linalg import norm
+from scipy.linalg import lu_factor, lu_solve, eigh
+from scipy.sparse import identity, kron, csr_matrix
+from scipy.sparse.linalg import splu, spilu, cg, LinearOperator
+
+from matrixDataType import *
+
+
+# keyword of the relative tolerance of cg (tol before scipy 1.12)
+cgTolerance = 'rtol' if 'rtol' in signature(cg).parameters else 'tol'
+
+
+# Just an interface for a pressure solver
+class PressureSolver(object):
+    '''
+    A pressure solver owns the pressure operator KP of a Domain and solves
+    KP p = FP for the nodal pressure.  The operator depends only on the grid
+    and the pressure boundary condition, so it is built on first use and
+    reused until invalidate() is called or the solver is used on a
+    different grid.
+
+    variables:
+        self.key      # (nCellsX, nCellsY, hx, hy, pinDOF) of the cached operator
+        self.KP       # assembled operator (dense or sparse), if any
+
+    methods:
+        def __init__(self)
+        def __str__(self)
+        def invalidate(self)
+        def isValid(self, domain)
+        def solve(self, domain, FP)
+        def getOperator(self)
+        def setup(self, domain)          # build and cache the operator
+        def solveSystem(self, FP, p0)    # solve using the cached operator; p0 is the current nodal pressure
+    '''
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        self.key = None
+        self.KP  = None
+
+    @abstractmethod
+    def __str__(self):
+        pass
+
+    def invalidate(self):
+        self.key = None
+
+    def isValid(self, domain):
+        return self.key == domain.getPressureOperatorKey()
+
+    def solve(self, domain, FP):
+        if not self.isValid(domain):
+            self.setup(domain)
+            self.key = domain.getPressureOperatorKey()
+        return self.solveSystem(FP, domain.grid.pressure.ravel())
+
+    def getOperator(self):
+        return self.KP
+
+    @abstractmethod
+    def setup(self, domain):
+        pass
+
+    @abstractmethod
+    def solveSystem(self, FP, p0=None):
+        pass
+
+
+class DirectPressureSolver(PressureSolver):
+    '''
+    assembles KP from the element stiffness, applies the pressure pin and
+    LU-factorizes it once.  Later solves are triangular solves only.
+
+    variables:
+        self.useDense     # dense LU for small systems
+        self.lu           # cached factorization
+    '''
+
+    def __init__(self, maxDenseDOF=100):
+        super().__init__()
+        # sparse outperformes dense very quickly for this problem.
+        self.maxDenseDOF = maxDenseDOF
+        self.useDense = False
+        self.lu = None
+
+    def __str__(self):
+        return "DirectPressureSolver"
+
+    def setup(self, domain):
+        ndof = (domain.nCellsX+1)*(domain.nCellsY+1)
+        self.useDense = (ndof <= self.maxDenseDOF)
+
+        # all cells share the same element matrix on the uniform grid
+        ke = domain.kernel.computeStiffness()
+        nCells = domain.nCellsX*domain.nCellsY
+
+        KP = domain.getAssembler()
+        KP.assemble(tile(ke, (nCells,1,1)))
+
+        # apply boundary conditions
+        dof = domain.getPressurePin()
+        KP.add(1.0e20, dof, dof)
+
+        if (self.useDense):
+            self.KP = KP.toCSRmatrix().toarray()
+            self.lu = lu_factor(self.KP)
+        else:
+            self.KP = KP.toCSCmatrix()
+            self.lu = splu(self.KP)
+
+    def solveSystem(self, FP, p0=None):
+        if (self.useDense):
+            return lu_solve(self.lu, FP)
+        else:
+            return self.lu.solve(FP)
+
+
+class FastDiagonalizationPressureSolver(PressureSolver):
+    '''
+    solves the pressure system on the rectangular nCellsX x nCellsY grid by
+    fast diagonalization.  The bilinear pressure Laplacian has Kronecker
+    structure
+
+        KP = My (x) Kx + Ky (x) Mx
+
+    with 1D stiffness and (consistent) mass matrices Kx, Mx, Ky, My.  The
+    generalized eigenproblems K V = M V diag(lam) are solved once; each solve
+    is then four dense matrix products, O(N^1.5), and no matrix is formed.
+
+    The pressure pin is treated exactly: the pinned system is equivalent to
+    the singular Neumann problem with equation `pin` dropped and p[pin] = 0.
+    Its residual at the pin balances the total load, so the load is made
+    compatible by adding -sum(FP) at the pin, the zero eigenmode is skipped,
+    and the constant is chosen such that p[pin] = 0.
+
+    variables:
+        self.Vx, self.lamX    # eigenvectors and eigenvalues in x-direction
+        self.Vy, self.lamY    # eigenvectors and eigenvalues in y-direction
+        self.denominator      # lamY[j] + lamX[i]
+        self.shape            # (nNodesY, nNodesX)
+        self.pin              # (j,i) of the pinned node
+    '''
+
+    def __init__(self):
+        super().__init__()
+
+    def __str__(self):
+        return "FastDiagonalizationPressureSolver"
+
+    def get1DMatrices(self, n, h):
+        # linear elements on n-1 segments of length h
+        d = full(n, 2.)
+        d[0]  = 1.
+        d[-1] = 1.
+        K = (diag(d) - diag(full(n-1, 1.), 1) - diag(full(n-1, 1.), -1)) / h
+        M = (2.*diag(d) + diag(full(n-1, 1.), 1) + diag(full(n-1, 1.), -1)) * h / 6.
+        return K, M
+
+    def setup(self, domain):
+        nx = domain.nCellsX + 1
+        ny = domain.nCellsY + 1
+
+        Kx, Mx = self.get1DMatrices(nx, domain.hx)
+        Ky, My = self.get1DMatrices(ny, domain.hy)
+
+        # eigenvectors are M-orthonormal: V^T M V = I, V^T K V = diag(lam)
+        self.lamX, self.Vx = eigh(Kx, Mx)
+        self.lamY, self.Vy = eigh(Ky, My)
+
+        self.denominator = self.lamY[:,None] + self.lamX[None,:]
+        # constant mode (smallest eigenvalue in both directions)
+        self.denominator[0,0] = 1.0
+
+        self.shape = (ny, nx)
+        pin = domain.getPressurePin()
+        self.pin = (pin // nx, pin % nx)
+        self.KP = None
+
+    def solveSystem(self, FP, p0=None):
+        F = FP.reshape(self.shape).copy()
+
+        # make the load compatible with the Neumann operator
+        F[self.pin] -= F.sum()
+
+        Q = (self.Vy.T @ F @ self.Vx) / self.denominator
+        Q[0,0] = 0.0
+
+        P = self.Vy @ Q @ self.Vx.T
+        P -= P[self.pin]
+
+        return P.ravel()
+
+
+class MultigridPressureSolver(PressureSolver):
+    '''
+    geometric multigrid for the pressure system on the structured grid.
+
+    Levels follow the natural coarsening of the nCellsX x nCellsY grid: a
+    direction is coarsened by 2 while its number of cells is even and at
+    least 4.  Transfer operators are bilinear prolongation P and restriction
+    P^T, coarse operators are Galerkin products P^T A P of the operator
+    assembled from the element stiffness, smoothing is damped Jacobi and the
+    coarsest level is solved directly.
+
+    The pin is handled as in the FastDiagonalizationPressureSolver: cycles
+    act on the (singular) Neumann operator with a compatible load, and the
+    result is shifted such that p = 0 at the pin.  Each solve starts from
+    the pressure currently stored on the nodes.
+
+    variables:
+        self.tolerance     # relative residual ||b - A p|| / ||b||
+        self.maxCycles
+        self.gamma         # 1 = V-cycle, 2 = W-cycle
+        self.nSmooth       # (pre, post) smoothing sweeps
+        self.omega         # Jacobi damping
+        self.verbose       # print cycles and residual of every solve (see also getIterationCounts)
+        self.A             # operator on each level (finest first)
+        self.P             # prolongation from level l+1 to level l
+        self.Dinv          # inverse diagonal on each level
+        self.omegas        # damping on each level
+        self.coarseLU      # factorization on the coarsest level
+        self.history       # [(cycles, residual)] of every solve
+    '''
+
+    def __init__(self, tolerance=1.e-8, maxCycles=50, cycle='V', nPreSmooth=2, nPostSmooth=2,
+                 omega=0.8, maxCoarseDOF=100, verbose=False):
+        super().__init__()
+        self.tolerance = tolerance
+        self.maxCycles = maxCycles
+        self.setCycle(cycle)
+        self.nSmooth = (nPreSmooth, nPostSmooth)
+        self.omega = omega
+        self.maxCoarseDOF = maxCoarseDOF
+        self.verbose = verbose
+        self.history = []
+
+    def __str__(self):
+        return "MultigridPressureSolver({}-cycle)".format('V' if self.gamma == 1 else 'W')
+
+    def setCycle(self, cycle):
+        if cycle not in ('V', 'W'):
+            raise ValueError("cycle must be 'V' or 'W'")
+        self.gamma = 1 if cycle == 'V' else 2
+
+    def setTolerance(self, tolerance, maxCycles=None):
+        self.tolerance = tolerance
+        if maxCycles != None:
+            self.maxCycles = maxCycles
+
+    def getIterationCounts(self):
+        return [ h[0] for h in self.history ]
+
+    def get1DProlongation(self, nCells):
+        # linear interpolation from nCells/2 to nCells cells
+        nc = nCells // 2
+        rows = []
+        cols = []
+        vals = []
+        for k in range(nc+1):
+            rows.append(2*k)
+            cols.append(k)
+            vals.append(1.0)
+        for k in range(nc):
+            rows += [2*k+1, 2*k+1]
+            cols += [k, k+1]
+            vals += [0.5, 0.5]
+        return csr_matrix((vals, (rows, cols)), shape=(nCells+1, nc+1))
+
+    def setup(self, domain):
+        ndof = (domain.nCellsX+1)*(domain.nCellsY+1)
+
+        ke = domain.kernel.computeStiffness()
+        nCells = domain.nCellsX*domain.nCellsY
+
+        assembler = domain.getAssembler()
+        assembler.assemble(tile(ke, (nCells,1,1)))
+
+        self.A = [ assembler.toCSRmatrix().copy() ]
+        self.P = []
+        self.pin = domain.getPressurePin()
+
+        nx = domain.nCellsX
+        ny = domain.nCellsY
+        while self.A[-1].shape[0] > self.maxCoarseDOF:
+            coarsenX = (nx % 2 == 0 and nx >= 4)
+            coarsenY = (ny % 2 == 0 and ny >= 4)
+            if not (coarsenX or coarsenY):
+                break
+
+            Px = self.get1DProlongation(nx) if coarsenX else identity(nx+1, format='csr')
+            Py = self.get1DProlongation(ny) if coarsenY else identity(ny+1, format='csr')
+            P  = kron(Py, Px, format='csr')    # y is the slow index
+
+            self.P.append(P)
+            self.A.append((P.T @ self.A[-1] @ P).tocsr())
+
+            nx = nx // 2 if coarsenX else nx
+            ny = ny // 2 if coarsenY else ny
+
+        self.Dinv = [ 1.0/A.diagonal() for A in self.A ]
+
+        # Jacobi damping per level, scaled by a Gershgorin bound of D^-1 A
+        # (the bound is 2 for square cells; stretched cells need more damping)
+        self.omegas = []
+        for A, Dinv in zip(self.A, self.Dinv):
+            bound = (abs(A) @ ones(A.shape[0]) * Dinv).max()
+            self.omegas.append(self.omega * 2.0 / max(bound, 2.0))
+
+        # coarsest level: drop equation 0 and fix that value (the system is consistent)
+        Ac = self.A[-1].tolil()
+        Ac[0,:] = 0.0
+        Ac[:,0] = 0.0
+        Ac[0,0] = 1.0
+        self.coarseLU = splu(Ac.tocsc())
+
+        self.KP = self.A[0]
+
+    def smooth(self, level, x, b, nSweeps):
+        A = self.A[level]
+        for k in range(nSweeps):
+            x += self.omegas[level] * self.Dinv[level] * (b - A @ x)
+        return x
+
+    def coarseSolve(self, b):
+        rhs = b.copy()
+        rhs[0] = 0.0
+        return self.coarseLU.solve(rhs)
+
+    def cycle(self, level, x, b):
+        if (level == len(self.A) - 1):
+            return self.coarseSolve(b)
+
+        x = self.smooth(level, x, b, self.nSmooth[0])
+
+        r  = b - self.A[level] @ x
+        rc = self.P[level].T @ r
+        ec = zeros(len(rc))
+        for k in range(self.gamma):
+            ec = self.cycle(level+1, ec, rc)
+        x += self.P[level] @ ec
+
+        return self.smooth(level, x, b, self.nSmooth[1])
+
+    def solveSystem(self, FP, p0=None):
+        # make the load compatible with the Neumann operator
+        b = FP.copy()
+        b[self.pin] -= b.sum()
+
+        x = zeros(len(b)) if p0 is None else p0.copy()
+
+        bnorm = norm(b)
+        if bnorm == 0.0:
+            self.history.append((0, 0.0))
+            return zeros(len(b))
+
+        residual = norm(b - self.A[0] @ x) / bnorm
+        cycles = 0
+        while residual > self.tolerance and cycles < self.maxCycles:
+            x = self.cycle(0, x, b)
+            cycles += 1
+            residual = norm(b - self.A[0] @ x) / bnorm
+
+        self.history.append((cycles, residual))
+        if self.verbose:
+            print("multigrid: {} cycles, relative residual {:.3e}".format(cycles, residual))
+        if residual > self.tolerance:
+            print("warning: multigrid did not converge in {} cycles".format(cycles))
+
+        return x - x[self.pin]
+
+
+class ConjugateGradientPressureSolver(PressureSolver):
+    '''
+    matrix-free preconditioned conjugate gradients for the pressure system.
+
+    KP is never formed.  The operator is applied to nodal pressure arrays
+    with the Kronecker form of the bilinear Laplacian,
+
+        KP p = My P Kx + Ky P Mx ,    P = p.reshape(nNodesY, nNodesX)
+
+    where the 1D matrices are tridiagonal and applied with array slices.
+    The pin is eliminated instead of penalized: row and column `pin` are
+    replaced by the identity, which keeps the operator SPD and matches the
+    penalty formulation to round-off.
+
+    Each solve starts from the nodal pressure of the previous step.
+    Preconditioners: 'none', 'jacobi' (matrix-free) or 'ilu' (incomplete
+    factorization of the assembled operator, built once in setup).
+
+    variables:
+        self.tolerance        # relative residual ||b - A p|| / ||b||
+        self.maxIterations
+        self.preconditioner
+        self.verbose          # print iterations and residual of every solve (see also getIterationCounts)
+        self.A                # LinearOperator
+        self.M                # preconditioner as LinearOperator (or None)
+        self.history          # [(iterations, residual)] of every solve
+    '''
+
+    def __init__(self, tolerance=1.e-8, maxIterations=None, preconditioner='jacobi', verbose=False):
+        super().__init__()
+        if preconditioner not in ('none', 'jacobi', 'ilu'):
+            raise ValueError("preconditioner must be 'none', 'jacobi' or 'ilu'")
+        self.tolerance = tolerance
+        self.maxIterations = maxIterations
+        self.preconditioner = preconditioner
+        self.verbose = verbose
+        self.history = []
+
+    def __str__(self):
+        return "ConjugateGradientPressureSolver({})".format(self.preconditioner)
+
+    def setTolerance(self, tolerance, maxIterations=None):
+        self.tolerance = tolerance
+        if maxIterations != None:
+            self.maxIterations = maxIterations
+
+    def getIterationCounts(self):
+        return [ h[0] for h in self.history ]
+
+    def get1DStencils(self, n, h):
+        # diagonals and off-diagonal of the 1D stiffness and mass matrices
+        d = full(n, 2.)
+        d[0]  = 1.
+        d[-1] = 1.
+        return (d/h, -1./h), (2.*d*h/6., h/6.)
+
+    def applyTridiagonal(self, P, stencil, axis):
+        d, o = stencil
+        if axis == 1:
+            Y = d[None,:]*P
+            Y[:,1:]  += o*P[:,:-1]
+            Y[:,:-1] += o*P[:,1:]
+        else:
+            Y = d[:,None]*P
+            Y[1:,:]  += o*P[:-1,:]
+            Y[:-1,:] += o*P[1:,:]
+        return Y
+
+    def applyOperator(self, p):
+        P = p.reshape(self.shape).copy()
+        P[self.pin] = 0.0
+
+        Y  = self.applyTridiagonal(self.applyTridiagonal(P, self.Kx, 1), self.My, 0)
+        Y += self.applyTridiagonal(self.applyTridiagonal(P, self.Mx, 1), self.Ky, 0)
+
+        Y[self.pin] = p.reshape(self.shape)[self.pin]
+        return Y.ravel()
+
+    def setup(self, domain):
+        nx = domain.nCellsX + 1
+        ny = domain.nCellsY + 1
+        ndof = nx*ny
+
+        self.Kx, self.Mx = self.get1DStencils(nx, domain.hx)
+        self.Ky, self.My = self.get1DStencils(ny, domain.hy)
+
+        self.shape = (ny, nx)
+        pin = domain.getPressurePin()
+        self.pin = (pin // nx, pin % nx)
+
+        self.A = LinearOperator((ndof,ndof), matvec=self.applyOperator, dtype=float)
+
+        if self.preconditioner == 'jacobi':
+            D = self.My[0][:,None]*self.Kx[0][None,:] + self.Ky[0][:,None]*self.Mx[0][None,:]
+            D[self.pin] = 1.0
+            Dinv = (1.0/D).ravel()
+            self.M = LinearOperator((ndof,ndof), matvec=lambda r: Dinv*r, dtype=float)
+        elif self.preconditioner == 'ilu':
+            ke = domain.kernel.computeStiffness()
+            assembler = domain.getAssembler()
+            assembler.assemble(tile(ke, (domain.nCellsX*domain.nCellsY,1,1)))
+            K = assembler.toCSRmatrix().tolil()
+            K[pin,:] = 0.0
+            K[:,pin] = 0.0
+            K[pin,pin] = 1.0
+            ilu = spilu(K.tocsc())
+            self.M = LinearOperator((ndof,ndof), matvec=ilu.solve, dtype=float)
+        else:
+            self.M = None
+
+        self.KP = None
+
+    def solveSystem(self, FP, p0=None):
+        b = FP.copy()
+        b[self.pin[0]*self.shape[1] + self.pin[1]] = 0.0
+
+        x0 = None if p0 is None else p0.copy()
+
+        iterations = [0]
+        def count(xk):
+            iterations[0] += 1
+
+        x, info = cg(self.A, b, x0=x0, atol=0.0, maxiter=self.maxIterations, M=self.M,
+                     callback=count, **{cgTolerance: self.tolerance})
+
+        bnorm = norm(b)
+        residual = norm(b - self.A @ x) / bnorm if bnorm > 0.0 else 0.0
+
+        self.history.append((iterations[0], residual))
+        if self.verbose:
+            print("pcg: {} iterations, relative residual {:.3e}".format(iterations[0], residual))
+        if info > 0:
+            print("warning: pcg did not converge in {} iterations".format(iterations[0]))
+
+        return x
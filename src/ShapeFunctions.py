@@ -0,0 +1,36 @@
+'''
+Bilinear shape functions of the 4-node cell as pure functions.
+
+Local node numbering follows Cell.SetNodes: (i,j), (i+1,j), (i+1,j+1),
+(i,j+1).  Local coordinates s, t run from -1 to +1 across the cell.
+
+The functions keep no state, so they may be called from several threads
+at once; they accept scalars or arrays of local coordinates.
+
+functions:
+    def clampLocal(xl)                  # local coordinates clamped to the cell
+    def shapeFunctions(s, t, size)      # returns N, DNx, DNy of shape (..., 4)
+'''
+from numpy import minimum, maximum, stack
+
+
+def clampLocal(xl):
+    # new array; Cell.setShape clamped its argument in place
+    return minimum(maximum(xl, -1.0), 1.0)
+
+
+def shapeFunctions(s, t, size):
+    '''
+    s, t ... local coordinates (scalars or arrays of equal shape)
+    size ... (hx, hy)
+
+    returns shape functions N and their x- and y-derivatives DNx, DNy
+    '''
+    sp = 0.5*(1. + s)
+    sm = 0.5*(1. - s)
+    tp = 0.5*(1. + t)
+    tm = 0.5*(1. - t)
+    N   = stack((sm*tm, sp*tm, sp*tp, sm*tp), -1)
+    DNx = stack((-tm, tm, tp, -tp), -1) / size[0]
+    DNy = stack((-sm, -sp, sp, sm), -1) / size[1]
+    return N, DNx, DNy
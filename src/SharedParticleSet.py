@@ -0,0 +1,97 @@
+from numpy import ndarray, empty, prod
+from multiprocessing.shared_memory import SharedMemory
+
+from ParticleSet import *
+
+
+class SharedParticleSet(ParticleSet):
+    '''
+    ParticleSet keeping all per-particle arrays in shared memory blocks
+    (multiprocessing.shared_memory), so that worker processes can work on
+    the particles in place (see ParallelAdvector).
+
+    A block is created for every array by allocate() and replaced only when
+    the set grows (reserve).  Blocks still referenced by arrays obtained
+    before the set grew are unlinked at once and closed as soon as
+    possible.  close() releases all blocks; the set is empty afterwards.
+
+    variables:
+        self.blocks   = {name: SharedMemory holding the current array}
+        self.retired  = [SharedMemory]   # unlinked blocks that could not be closed yet
+        self.created  = {name: SharedMemory allocated by the reserve() in progress}
+
+    methods:
+        def __init__(self, capacity=16)
+        def allocate(self, name, shape, dtype)
+        def reserve(self, capacity)
+        def getBlock(self, name)
+        def release(self, block)
+        def close(self)
+    '''
+
+    def __init__(self, capacity=16):
+        '''
+        Constructor
+        '''
+        self.blocks  = {}
+        self.retired = []
+        self.created = {}
+
+        super().__init__(capacity)
+
+    def __str__(self):
+        return "SharedParticleSet({} particles)".format(self.nParticles)
+
+    def __repr__(self):
+        return "SharedParticleSet({})".format(self.capacity)
+
+    def __del__(self):
+        self.close()
+
+    def allocate(self, name, shape, dtype):
+        nbytes = int(prod(shape)) * empty(0, dtype=dtype).itemsize
+        block = SharedMemory(create=True, size=max(nbytes, 1))
+        self.created[name] = block
+        return ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    def reserve(self, capacity):
+        if (capacity <= self.capacity):
+            return
+
+        super().reserve(capacity)
+
+        # the data have been copied to the new blocks
+        for name, block in self.created.items():
+            if name in self.blocks:
+                self.release(self.blocks[name])
+            self.blocks[name] = block
+        self.created = {}
+
+        for block in self.retired[:]:
+            self.release(block)
+
+    def getBlock(self, name):
+        a = getattr(self, name)
+        return (name, 'shm', self.blocks[name].name, a.shape, a.dtype.str)
+
+    def release(self, block):
+        if block not in self.retired:
+            block.unlink()
+            self.retired.append(block)
+        try:
+            block.close()
+            self.retired.remove(block)
+        except BufferError:
+            pass   # arrays on the block are still in use
+
+    def close(self):
+        # drop the arrays on the blocks; the set is empty afterwards
+        for name in self.slotFields + ('handleOf', 'slotOf'):
+            setattr(self, name, getattr(self, name)[:0].copy())
+        self.nParticles = 0
+        self.capacity   = 0
+        self.order      = None
+
+        for block in list(self.blocks.values()) + self.retired[:]:
+            self.release(block)
+        self.blocks = {}
@@ -0,0 +1,64 @@
+from numpy import array, zeros, tile, repeat, arange, ceil, inf
+
+
+class TracerInjector(object):
+    '''
+    Continuous release of tracer particles from fixed seed points
+    (streaklines).
+
+    Each seed point releases rate particles per second between start and
+    stop, one every 1/rate seconds, starting at start.  Releases are spread
+    over the step: getReleases returns the release time of every particle,
+    so that the particle can be advanced by the rest of the step after its
+    release.  Released particles are retired after lifetime seconds.
+
+    variables:
+        self.seeds    = (nSeeds, 2)   # release positions
+        self.rate     # particles per second and seed
+        self.lifetime # seconds (inf = never retire)
+        self.mass     # mass of a released particle
+        self.start    # first release time
+        self.stop     # last release time
+        self.wait     # time from the end of the last step to the next release
+        self.released # number of particles released so far
+
+    methods:
+        def __init__(self, seeds, rate, lifetime=inf, mass=1.0, start=0.0, stop=inf)
+        def getReleases(self, time, dt)   # positions and times of the particles released in [time, time+dt)
+    '''
+
+    def __init__(self, seeds, rate, lifetime=inf, mass=1.0, start=0.0, stop=inf):
+        '''
+        Constructor
+        '''
+        self.seeds    = array(seeds, dtype=float).reshape((-1,2))
+        self.rate     = rate
+        self.lifetime = lifetime
+        self.mass     = mass
+        self.start    = start
+        self.stop     = stop
+
+        self.wait     = 0.0
+        self.released = 0
+
+    def __str__(self):
+        return "TracerInjector({} seeds, {}/s, lifetime {}s)".format(len(self.seeds), self.rate, self.lifetime)
+
+    def getReleases(self, time, dt):
+        '''
+        returns the positions (n*nSeeds, 2) and release times (n*nSeeds,)
+        of the particles released in [time, time+dt), in order of release
+        '''
+        # part of the interval [time, time+dt) within [start, stop]
+        begin = max(time, self.start)
+        end   = min(time + dt, self.stop)
+        if (end <= begin or self.rate <= 0.0):
+            return zeros((0,2)), zeros(0)
+
+        first = begin + self.wait
+        times = first + arange(max(int(ceil((end - first) * self.rate)), 0)) / self.rate
+        times = times[times < end]
+        self.wait = first + len(times) / self.rate - end
+
+        self.released += len(times)*len(self.seeds)
+        return tile(self.seeds, (len(times),1)), repeat(times, len(self.seeds))
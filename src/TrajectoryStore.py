@@ -0,0 +1,225 @@
+from numpy import zeros, full, concatenate, searchsorted, asarray, nan, int64
+
+
+class TrajectoryStore(object):
+    '''
+    Particle traces in one preallocated ring buffer.
+
+    A frame holds the positions of the traced particles at one time and is
+    stored in self.frames[(frame number) % (frames allocated)].  Only traced particles
+    own a column of the buffer: self.column maps a particle handle to its
+    column, and columns of particles that stop tracing are re-used.  A column
+    is cleared (NaN) when it is handed to a new particle, so a re-used handle
+    never sees the frames of its predecessor.
+
+    Only every stride-th call of record() stores a frame.  Without a
+    capacity (the default) the buffer doubles whenever it is full, so every
+    frame is kept.  With a capacity, once capacity frames are stored the
+    oldest are overwritten.  window limits the traces returned to the last
+    window seconds.
+
+    Traces are returned as views into the buffer as long as the requested
+    frames do not wrap around the end of the ring.
+
+    variables:
+        self.capacity     # frames kept (None = all, the buffer grows on demand)
+        self.stride
+        self.window       # duration of the returned traces (None = everything stored)
+        self.frames       = (nSlots, nColumns, 2)   # nSlots = capacity if set
+        self.times        = (nSlots,)
+        self.column       = (nHandles,)   # column of a traced particle handle, -1 if not traced
+        self.handleOf     = (nColumns,)   # handle recorded in a column, -1 if the column is free
+        self.firstFrame   = (nColumns,)   # frame at which a column started recording, -1 if free
+        self.nFrames      # frames recorded since the last clear()
+        self.nUpdates     # calls of record() since the last clear()
+
+    methods:
+        def __init__(self, capacity=None, stride=1, window=None)
+        def setCapacity(self, capacity)
+        def setStride(self, stride)
+        def setWindow(self, window)
+        def clear(self)
+        def stopTrace(self, handle)
+        def record(self, handles, positions, time)
+        def assign(self, handles)           # columns for newly traced handles
+        def allocate(self, nColumns, nSlots=0)
+        def getFrameRange(self, first=0)
+        def select(self, data, start, stop)
+        def getTimes(self)
+        def getFrames(self)
+        def getColumns(self, handles)       # columns of handles, -1 if not traced
+        def getTrace(self, handle)
+    '''
+
+    def __init__(self, capacity=None, stride=1, window=None):
+        '''
+        Constructor
+        '''
+        self.capacity = capacity
+        self.stride   = stride
+        self.window   = window
+
+        self.frames     = zeros((0,0,2))
+        self.times      = zeros(0)
+        self.column     = zeros(0, dtype=int64)
+        self.handleOf   = zeros(0, dtype=int64)
+        self.firstFrame = zeros(0, dtype=int64)
+        self.clear()
+
+    def __str__(self):
+        start, stop = self.getFrameRange()
+        return "TrajectoryStore({} of {} frames, {} particles)".format(stop - start, self.capacity or 'unlimited',
+                                                                       (self.handleOf >= 0).sum())
+
+    def setCapacity(self, capacity):
+        self.capacity = capacity
+        self.frames = zeros((0,0,2))
+        self.times  = zeros(0)
+        self.handleOf   = zeros(0, dtype=int64)
+        self.firstFrame = zeros(0, dtype=int64)
+        self.clear()
+
+    def setStride(self, stride):
+        self.stride = stride
+
+    def setWindow(self, window):
+        self.window = window
+
+    def clear(self):
+        self.nFrames  = 0
+        self.nUpdates = 0
+        self.column[:]     = -1
+        self.handleOf[:]   = -1
+        self.firstFrame[:] = -1
+
+    def stopTrace(self, handle):
+        # handle may be a single handle or an array of handles
+        handle = asarray(handle, dtype=int64).ravel()
+        handle = handle[handle < len(self.column)]
+        columns = self.column[handle]
+        columns = columns[columns >= 0]
+        self.handleOf[columns]   = -1
+        self.firstFrame[columns] = -1
+        self.column[handle] = -1
+
+    def record(self, handles, positions, time):
+        '''
+        handles   ... (nTraced,) handles of the traced particles
+        positions ... (nTraced, 2) their positions
+        '''
+        self.nUpdates += 1
+        if ((self.nUpdates - 1) % self.stride != 0):
+            return
+
+        handles = asarray(handles, dtype=int64)
+
+        # release the columns of particles no longer traced
+        traced = self.getColumns(handles)
+        keep = zeros(len(self.handleOf), dtype=bool)
+        keep[traced[traced >= 0]] = True
+        self.stopTrace(self.handleOf[(self.handleOf >= 0) & ~keep])
+
+        if (len(self.times) == 0):
+            self.allocate(len(handles), self.capacity or 128)
+        elif (self.capacity is None and self.nFrames == len(self.times)):
+            self.allocate(0, 2*len(self.times))
+
+        columns = self.assign(handles)
+
+        k = self.nFrames % len(self.times)
+        self.frames[k,columns] = positions
+        self.times[k] = time
+        self.nFrames += 1
+
+    def assign(self, handles):
+        if (len(handles) > 0 and handles.max() >= len(self.column)):
+            column = full(max(handles.max() + 1, 2*len(self.column)), -1, dtype=int64)
+            column[:len(self.column)] = self.column
+            self.column = column
+
+        columns = self.column[handles]
+        new = (columns < 0).nonzero()[0]
+        if (len(new) > 0):
+            free = (self.handleOf < 0).nonzero()[0]
+            if (len(free) < len(new)):
+                self.allocate(len(self.handleOf) + len(new) - len(free))
+                free = (self.handleOf < 0).nonzero()[0]
+
+            free = free[:len(new)]
+            self.frames[:,free] = nan
+            self.firstFrame[free] = self.nFrames
+            self.handleOf[free] = handles[new]
+            self.column[handles[new]] = free
+            columns[new] = free
+
+        return columns
+
+    def allocate(self, nColumns, nSlots=0):
+        # grow the buffer, keeping the frames recorded so far; frames are
+        # only added while the ring has not wrapped (capacity None)
+        slots, old = self.frames.shape[:2]
+        if (nColumns > old):
+            nColumns = max(nColumns, 2*old)
+        nColumns = max(nColumns, old)
+        nSlots   = max(nSlots, slots)
+        frames = full((nSlots, nColumns, 2), nan)
+        times  = zeros(nSlots)
+        handleOf = full(nColumns, -1, dtype=int64)
+        first    = full(nColumns, -1, dtype=int64)
+        if (slots > 0):
+            frames[:slots,:old] = self.frames
+            times[:slots]       = self.times
+            handleOf[:old]      = self.handleOf
+            first[:old]         = self.firstFrame
+        else:
+            self.column[:] = -1
+        self.frames     = frames
+        self.times      = times
+        self.handleOf   = handleOf
+        self.firstFrame = first
+
+    def getFrameRange(self, first=0):
+        # frame numbers [start, stop) still stored, within the window and not before first
+        stop  = self.nFrames
+        start = max(first, stop - len(self.times), 0)
+
+        if (self.window != None and stop > start):
+            times = self.select(self.times, start, stop)
+            start += searchsorted(times, times[-1] - self.window)
+
+        return start, stop
+
+    def select(self, data, start, stop):
+        # frames start ... stop-1 of a ring-indexed array, in chronological order
+        n = len(data)
+        if (stop <= start):
+            return data[:0]
+        a = start % n
+        b = a + (stop - start)
+        if (b <= n):
+            return data[a:b]
+        return concatenate((data[a:], data[:b - n]))
+
+    def getTimes(self):
+        return self.select(self.times, *self.getFrameRange())
+
+    def getFrames(self):
+        # (nFrames, nColumns, 2) positions of the traced particles
+        start, stop = self.getFrameRange()
+        return self.select(self.frames, start, stop)
+
+    def getColumns(self, handles):
+        handles = asarray(handles, dtype=int64)
+        columns = full(handles.shape, -1, dtype=int64)
+        known = handles < len(self.column)
+        columns[known] = self.column[handles[known]]
+        return columns
+
+    def getTrace(self, handle):
+        # (nFrames, 2) positions of one particle since it started recording
+        column = self.getColumns(handle)
+        if (column < 0):
+            return zeros((0,2))
+
+        start, stop = self.getFrameRange(self.firstFrame[column])
+        return self.select(self.frames[:,column], start, stop)
@@ -20,6 +20,8 @@ class Writer(object):
         self.X
         self.Vx
         self.Vy
+        self.Ax           # apparent acceleration
+        self.Ay
         self.speed
         self.gs
         self.tracerPoints = [[],[]]
@@ -71,6 +73,8 @@ class Writer(object):
         self.Vy = np.zeros_like(self.X)
         self.Fx = np.zeros_like(self.X)
         self.Fy = np.zeros_like(self.X)
+        self.Ax = np.zeros_like(self.X)
+        self.Ay = np.zeros_like(self.X)
         
         for i in range(self.nNodesX):
             for j in range(self.nNodesY):
@@ -82,9 +86,17 @@ class Writer(object):
                 force = node.getForce()
                 self.Fx[j,i] = force[0]
                 self.Fy[j,i] = force[1]
+                accel = node.getApparentAccel()
+                self.Ax[j,i] = accel[0]
+                self.Ay[j,i] = accel[1]
         
         self.speed = np.sqrt(self.Vx*self.Vx + self.Vy*self.Vy)
         
+    def setGridData(self, grid):
+        self.particlesPresent = False
+        
+        self.P, self.Vx, self.Vy, self.Fx, self.Fy, self.Ax, self.Ay, self.speed = grid.getNodalFields()
+        
     def setParticleData(self, particles):
         if (len(particles) == 0):
             return
@@ -126,4 +138,11 @@ class Writer(object):
         fname = os.path.join('data', "pressure{:03d}.txt".format(self.DATA_COUNTER))
         np.savetxt(fname, self.P, header=hdr)
 
+        # apparent accelerations, for tracer runs from the stored data (OfflineTracer)
+        fname = os.path.join('data', "ax{:03d}.txt".format(self.DATA_COUNTER))
+        np.savetxt(fname, self.Ax, header=hdr)
+
+        fname = os.path.join('data', "ay{:03d}.txt".format(self.DATA_COUNTER))
+        np.savetxt(fname, self.Ay, header=hdr)
+
 
@@ -0,0 +1,63 @@
+# ====== settings ================
+
+
+PARTICLE_COUNTS = [10**5, 10**6, 10**7]
+
+NUM_CELLS = 128
+
+NUM_STEPS = 3
+
+TIME_STEP = 0.001
+
+CHUNK_SIZES = [10**4, 10**5, 10**6]
+
+DIRECTORY = None       # location of the particle files (None = temporary directory)
+
+# ====== the benchmark ===========
+from Domain import *
+from Motion import *
+import numpy as np
+
+
+def createDomain():
+    domain = Domain(1., 1., NUM_CELLS, NUM_CELLS)
+    domain.setMotion(Motion2())
+    domain.setTimeIntegrator(RungeKutta4())
+    domain.setAnalysis(False, False, False, False, False, True, False, False)
+    domain.setState(0.0)
+    return domain
+
+
+def seedParticles(pset, nParticles):
+    # add the particles in chunks, so the seeding does not need memory for all of them
+    rng = np.random.default_rng(1)
+    for first in range(0, nParticles, CHUNK_SIZES[-1]):
+        pset.addParticles(1.0, rng.uniform(0.05, 0.95, (min(CHUNK_SIZES[-1], nParticles - first), 2)))
+
+
+def Main():
+    print("{:>10s} {:>10s}".format("particles", "chunk") + " {:>16s}".format("particles/s"))
+
+    for nParticles in PARTICLE_COUNTS:
+        pset = MappedParticleSet(DIRECTORY, nParticles)
+        seedParticles(pset, nParticles)
+
+        domain = createDomain()
+        domain.setParticleSet(pset)
+
+        time = 0.0
+        for chunkSize in CHUNK_SIZES:
+            domain.setParticleChunkSize(chunkSize)
+            domain.advector.resetStatistics()
+            for step in range(NUM_STEPS):
+                domain.runSingleStep(time, TIME_STEP)
+                time += TIME_STEP
+
+            stats = domain.getAdvectionStatistics()
+            print("{:>10d} {:>10d} {:16.4e}".format(nParticles, chunkSize, stats['particles/s']))
+
+        pset.close()
+
+
+if __name__ == '__main__':
+    Main()
@@ -0,0 +1,67 @@
+# ====== settings ================
+
+
+NUM_PARTICLES = 10**6
+
+NUM_CELLS = 128
+
+NUM_STEPS = 5
+
+TIME_STEP = 0.001
+
+WORKER_COUNTS = [1, 2, 4, 8, 16, 32]
+
+# ====== the benchmark ===========
+from Domain import *
+from Motion import *
+from time import perf_counter
+import numpy as np
+
+
+def createDomain():
+    domain = Domain(1., 1., NUM_CELLS, NUM_CELLS)
+    domain.setMotion(Motion2())
+    domain.setTimeIntegrator(RungeKutta4())
+    domain.setAnalysis(False, False, False, False, False, True, False, False)
+    domain.setState(0.0)
+    return domain
+
+
+def timeAdvection(domain, pset):
+    fields = domain.getAdvectionFields()
+
+    # the first call starts the workers
+    domain.advector.advance(pset, fields, TIME_STEP)
+
+    start = perf_counter()
+    for step in range(NUM_STEPS):
+        domain.advector.advance(pset, fields, TIME_STEP)
+    elapsed = perf_counter() - start
+
+    return NUM_STEPS * len(pset) / elapsed
+
+
+def Main():
+    domain = createDomain()
+
+    # the workers advance the particles in place in shared memory
+    pset = SharedParticleSet(NUM_PARTICLES)
+    pset.addParticles(1.0, np.random.default_rng(1).uniform(0.05, 0.95, (NUM_PARTICLES, 2)))
+
+    print("{:>8s} {:>16s} {:>10s} {:>11s}".format("workers", "particles/s", "speedup", "efficiency"))
+
+    for nWorkers in WORKER_COUNTS:
+        domain.setParallelAdvection(nWorkers)
+        rate = timeAdvection(domain, pset)
+        if (nWorkers == WORKER_COUNTS[0]):
+            serialRate = rate * WORKER_COUNTS[0]
+
+        speedup = rate / serialRate
+        print("{:>8d} {:16.4e} {:10.2f} {:11.2f}".format(nWorkers, rate, speedup, speedup / nWorkers))
+
+    domain.setParallelAdvection(1)
+    pset.close()
+
+
+if __name__ == '__main__':
+    Main()
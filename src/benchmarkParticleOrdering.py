@@ -0,0 +1,83 @@
+# ====== settings ================
+
+
+PARTICLE_COUNTS = [10**5, 10**6, 10**7]
+
+NUM_CELLS = 512
+
+NUM_STEPS = 3
+
+TIME_STEP = 0.01
+
+CHUNK_SIZE = 10**6     # particles advanced per call, bounds the temporary memory
+
+CURVES = ['morton', 'hilbert']
+
+# ====== the benchmark ===========
+from Domain import *
+from Motion import *
+from time import perf_counter
+import numpy as np
+
+
+def createDomain():
+    domain = Domain(1., 1., NUM_CELLS, NUM_CELLS)
+    domain.setMotion(Motion2())
+    domain.setTimeIntegrator(RungeKutta4())
+    domain.setAnalysis(False, False, False, False, False, True, False, False)
+    domain.setState(0.0)
+    return domain
+
+
+def seedParticles(domain, nParticles):
+    # random seeding, i.e., storage order unrelated to position
+    # (the state of a well-mixed flow after many steps)
+    pset = ParticleSet(nParticles)
+    X = np.random.default_rng(1).uniform(0.05, 0.95, (nParticles, 2))
+    pset.addParticles(1.0, X)
+    pset.hostCell[:nParticles] = domain.findCells(X)[0]
+    return pset
+
+
+def timeAdvection(domain, pset):
+    fields = domain.getAdvectionFields()
+
+    start = perf_counter()
+    for step in range(NUM_STEPS):
+        for first in range(0, len(pset), CHUNK_SIZE):
+            domain.advector.advance(pset, fields, TIME_STEP, first, min(first + CHUNK_SIZE, len(pset)))
+    elapsed = perf_counter() - start
+
+    return NUM_STEPS * len(pset) / elapsed
+
+
+def Main():
+    domain = createDomain()
+
+    print("{:>10s} {:>12s}".format("particles", "ordering") + " {:>16s}".format("particles/s"))
+
+    for nParticles in PARTICLE_COUNTS:
+        pset = seedParticles(domain, nParticles)
+
+        rate = timeAdvection(domain, pset)
+        print("{:>10d} {:>12s} {:16.4e}".format(nParticles, "unsorted", rate))
+
+        for curve in CURVES:
+            # undo the previous sort to start from a scattered storage again
+            pset.permute(np.argsort(pset.getIDs(), kind='stable'))
+            pset.position[:nParticles] = np.random.default_rng(1).uniform(0.05, 0.95, (nParticles, 2))
+            pset.hostCell[:nParticles] = domain.findCells(pset.getPositions())[0]
+
+            ordering = ParticleOrdering(NUM_CELLS, NUM_CELLS, curve)
+            start = perf_counter()
+            ordering.reorder(pset)
+            sortTime = perf_counter() - start
+
+            rate = timeAdvection(domain, pset)
+            print("{:>10d} {:>12s} {:16.4e}   (sort: {:.3f}s)".format(nParticles, curve, rate, sortTime))
+
+        del pset
+
+
+if __name__ == '__main__':
+    Main()
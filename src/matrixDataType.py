@@ -3,7 +3,7 @@ Created on Jun 26, 2018
 
 @author: pmackenz
 '''
-from numpy import array
+from numpy import array, asarray, zeros, repeat, tile, unique, concatenate, cumsum, bincount, searchsorted, int64
 from scipy.sparse import csc_matrix, csr_matrix, dok_matrix
 
 class matrixDataType(object):
@@ -39,3 +39,76 @@ class matrixDataType(object):
         return csr_matrix(self.smat, copy=False)
         
 
+
+
+class SparseAssembler(object):
+    '''
+    Assembly of global operators with a fixed sparsity pattern.
+
+    The CSR pattern and the map from every element matrix entry to its
+    position in the CSR data array are computed once per mesh.  Each
+    assembly afterwards is a single bincount into the data array.
+
+    variables:
+        self.ndof
+        self.elementDofs   # (nElements, nen) global dofs of each element
+        self.indptr        # CSR row pointers
+        self.indices       # CSR column indices
+        self.scatterMap    # CSR data index of each element matrix entry
+        self.data          # CSR data of the last assembled operator
+
+    methods:
+        def __init__(self, ndof, elementDofs)
+        def __str__(self, *args, **kwargs)
+        def __repr__(self, *args, **kwargs)
+        def nnz(self)
+        def assemble(self, elementMatrices)       # (nElements, nen, nen)
+        def assembleVector(self, elementVectors)  # (nElements, nen)
+        def add(self, val, i, j)
+        def toCSCmatrix(self)
+        def toCSRmatrix(self)
+    '''
+
+    def __init__(self, ndof, elementDofs):
+        self.ndof = ndof
+        self.elementDofs = asarray(elementDofs)
+        nen = self.elementDofs.shape[1]
+
+        # global (row, col) of entry (a,b) of every element matrix
+        rows = repeat(self.elementDofs, nen, axis=1).ravel().astype(int64)
+        cols = tile(self.elementDofs, (1,nen)).ravel().astype(int64)
+
+        keys, self.scatterMap = unique(rows*ndof + cols, return_inverse=True)
+        self.scatterMap = self.scatterMap.ravel()
+
+        self.indices = keys % ndof
+        self.indptr  = concatenate(([0], cumsum(bincount(keys // ndof, minlength=ndof))))
+        self.data    = zeros(len(keys))
+
+    def __str__(self, *args, **kwargs):
+        return str(self.toCSRmatrix())
+
+    def __repr__(self, *args, **kwargs):
+        return "SparseAssembler(ndof={}, nnz={})".format(self.ndof, self.nnz())
+
+    def nnz(self):
+        return len(self.indices)
+
+    def assemble(self, elementMatrices):
+        self.data = bincount(self.scatterMap, weights=asarray(elementMatrices).ravel(), minlength=self.nnz())
+
+    def assembleVector(self, elementVectors):
+        return bincount(self.elementDofs.ravel(), weights=asarray(elementVectors).ravel(), minlength=self.ndof)
+
+    def add(self, val, i, j):
+        start = self.indptr[i]
+        k = start + searchsorted(self.indices[start:self.indptr[i+1]], j)
+        if (k >= self.indptr[i+1] or self.indices[k] != j):
+            raise IndexError("entry ({},{}) is not in the sparsity pattern".format(i,j))
+        self.data[k] += val
+
+    def toCSCmatrix(self):
+        return self.toCSRmatrix().tocsc()
+
+    def toCSRmatrix(self):
+        return csr_matrix((self.data, self.indices, self.indptr), shape=(self.ndof,self.ndof))